@@ -1,13 +1,13 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import os
 import json
 import numpy as np
 import argparse
-from alpha_vantage.timeseries import TimeSeries
 
-ALPHA_VANTAGE_API_KEY = os.environ.get("ALPHA_VANTAGE_API_KEY", "YOUR_API_KEY_HERE")
+from instrumentation import span, profiled
+from market_data import get_provider
+
 
 def randn_bm():
     # Generate a random number from a standard normal distribution using the Box-Muller transform.
@@ -32,17 +32,15 @@ def simulate_portfolio(initial_amount, monthly_contribution, years, annual_retur
     return portfolio_values
 
 def get_stock_stats(ticker, period_days=5*252):
-    ts = TimeSeries(key=ALPHA_VANTAGE_API_KEY, output_format='pandas', indexing_type='date')
-    data, _ = ts.get_daily(symbol=ticker, outputsize='full')
-    data.sort_index(inplace=True)
+    data = get_provider("alphavantage").history(ticker, period="max")
     if len(data) < period_days:
         raise ValueError(f"Not enough data for ticker: {ticker}")
     data = data.tail(period_days)
     
-    if "4. close" not in data.columns:
-        raise ValueError(f"Expected '4. close' column not found for ticker: {ticker}")
+    if "Close" not in data.columns:
+        raise ValueError(f"Expected 'Close' column not found for ticker: {ticker}")
     
-    data['Daily Return'] = data["4. close"].pct_change().dropna()
+    data['Daily Return'] = data["Close"].pct_change().dropna()
     if data.empty:
         raise ValueError(f"Not enough data to calculate daily returns for ticker: {ticker}")
     
@@ -51,19 +49,7 @@ def get_stock_stats(ticker, period_days=5*252):
     
     return annual_return, annual_volatility
 
-def main():
-    parser = argparse.ArgumentParser(description="Portfolio Investment Simulation")
-    parser.add_argument("--ticker", type=str, required=True, help="Comma-separated stock tickers")
-    parser.add_argument("--years", type=int, required=True, help="Investment duration in years")
-    parser.add_argument("--initialAmount", type=float, required=True, help="Initial investment amount")
-    parser.add_argument("--monthlyContribution", type=float, required=True, help="Monthly contribution")
-    args = parser.parse_args()
-
-    tickers = [t.strip().upper() for t in args.ticker.split(",")]
-    years = args.years
-    initial_amount = args.initialAmount
-    monthly_contribution = args.monthlyContribution
-
+def run_simulation(tickers, years, initial_amount, monthly_contribution):
     portfolio_paths = []
     final_values = []
 
@@ -71,10 +57,10 @@ def main():
         try:
             annual_ret, volatility = get_stock_stats(ticker)
         except Exception as e:
-            print(json.dumps({"error": f"Error fetching stats for {ticker}: {str(e)}"}))
-            return
+            return {"error": f"Error fetching stats for {ticker}: {str(e)}"}
 
-        values = simulate_portfolio(initial_amount, monthly_contribution, years, annual_ret, volatility)
+        with span("simulation"):
+            values = simulate_portfolio(initial_amount, monthly_contribution, years, annual_ret, volatility)
         portfolio_paths.append({
             "ticker": ticker,
             "values": values
@@ -85,7 +71,7 @@ def main():
     p10 = float(np.percentile(final_values, 10))
     p90 = float(np.percentile(final_values, 90))
 
-    result = {
+    return {
         "tickers": tickers,
         "years": years,
         "median_value": median_value,
@@ -93,6 +79,18 @@ def main():
         "p90": p90,
         "portfolio_paths": portfolio_paths
     }
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio Investment Simulation")
+    parser.add_argument("--ticker", type=str, required=True, help="Comma-separated stock tickers")
+    parser.add_argument("--years", type=int, required=True, help="Investment duration in years")
+    parser.add_argument("--initialAmount", type=float, required=True, help="Initial investment amount")
+    parser.add_argument("--monthlyContribution", type=float, required=True, help="Monthly contribution")
+    args = parser.parse_args()
+
+    tickers = [t.strip().upper() for t in args.ticker.split(",")]
+    with profiled("investment_simulation"), span("request", script="investment_simulation"):
+        result = run_simulation(tickers, args.years, args.initialAmount, args.monthlyContribution)
     print(json.dumps(result))
 
 if __name__ == "__main__":
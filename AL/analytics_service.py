@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import matplotlib
+matplotlib.use('Agg')
+
+from instrumentation import span, flush as flush_metrics
+
+logging.basicConfig(filename="analytics_service.log", level=logging.INFO,
+                    format="%(asctime)s %(levelname)s: %(message)s")
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 5002
+MAX_WORKERS = 4
+MAX_PENDING = 16
+DEFAULT_DEADLINE = 120
+MAX_BODY_BYTES = 10 * 1024 * 1024
+# Express serves backend/static at /static; the CLI scripts used to write there because Node spawned them
+# from backend/, so the service writes its charts to the same place whatever its own working directory is.
+STATIC_DIR = os.environ.get("ANALYTICS_STATIC_DIR",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "static"))
+STATIC_URL_PREFIX = "static"
+
+_modules = {}
+_module_lock = threading.Lock()
+
+def get_module(name):
+    # Imports stay resident, so TensorFlow, Prophet and pandas are paid for once per service process.
+    module = _modules.get(name)
+    if module is None:
+        with _module_lock:
+            module = _modules.get(name)
+            if module is None:
+                module = importlib.import_module(name)
+                _modules[name] = module
+    return module
+
+def run_portfolio(payload):
+    portfolio = get_module("portfolio")
+    recommendations, required_PMT = portfolio.recommend_portfolio(
+        payload["risk_level"],
+        float(payload["income"]),
+        int(payload["goal_duration"]),
+        float(payload["monthly_investment"]),
+        float(payload["target_amount"]),
+        forecast_method=payload.get("forecast_method", portfolio.DEFAULT_FORECAST_METHOD)
+    )
+    return {"recommendations": recommendations, "required_PMT": required_PMT}
+
+def run_risk_analysis(payload):
+    investments = payload["investments"] if isinstance(payload, dict) else payload
+    return get_module("modified_spa").analyze_portfolio(investments, fig_dir=os.path.abspath(STATIC_DIR),
+                                                        url_prefix=STATIC_URL_PREFIX)
+
+def run_simulation(payload):
+    tickers = payload["ticker"]
+    if isinstance(tickers, str):
+        tickers = tickers.split(",")
+    tickers = [t.strip().upper() for t in tickers]
+    return get_module("Investment_Simulation").run_simulation(
+        tickers, int(payload["years"]), float(payload["initialAmount"]), float(payload["monthlyContribution"]))
+
+def run_optimize_spending(payload):
+    spending = get_module("spending_analysis")
+    if "records" in payload:
+        return {"results": spending.optimize_spending_batch(payload["records"])}
+    if "scenarios" in payload:
+        return spending.scenario_grid_from_input(payload)
+    try:
+        income = float(payload["income"])
+        target_amount = float(payload["target_amount"])
+        interest_rate = float(payload["interest_rate"])
+        start_date = payload["start_date"]
+        end_date = payload["end_date"]
+        expenses = payload["expenses"]
+    except Exception as e:
+        return {"error": f"Invalid input format: {str(e)}"}
+    return spending.optimize_spending(income, expenses, target_amount, interest_rate, start_date, end_date)
+
+def run_insights(payload):
+    return get_module("insights").main()
+
+# route -> (handler, modules to preload, max concurrent runs of this route)
+ROUTES = {
+    "/portfolio": (run_portfolio, ["portfolio"], 1),
+    "/risk-analysis": (run_risk_analysis, ["modified_spa"], 1),
+    "/simulate": (run_simulation, ["Investment_Simulation"], MAX_WORKERS),
+    "/optimize-spending": (run_optimize_spending, ["spending_analysis"], MAX_WORKERS),
+    "/insights": (run_insights, ["insights"], 1),
+}
+
+class AnalyticsService:
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, deadline=DEFAULT_DEADLINE):
+        # Each route gets its own workers, sized to its slot count, so slow /insights or /risk-analysis runs
+        # can never occupy the threads the light routes need. matplotlib/pyplot and the per-script cache
+        # files are not safe to share, so some routes run one at a time: two /portfolio runs would train
+        # the same tickers and write the same saved_models/ and cache/ files without any locking.
+        limits = {route: min(limit, max_workers) for route, (_, _, limit) in ROUTES.items()}
+        self.executors = {route: ThreadPoolExecutor(max_workers=limit,
+                                                    thread_name_prefix="analytics" + route.replace("/", "-"))
+                          for route, limit in limits.items()}
+        self.route_slots = {route: threading.BoundedSemaphore(limit) for route, limit in limits.items()}
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.deadline = deadline
+
+    def preload(self, routes=None):
+        for route in routes or ROUTES:
+            for name in ROUTES[route][1]:
+                started = time.time()
+                get_module(name)
+                logging.info(f"Preloaded {name} in {time.time() - started:.1f}s")
+
+    def _run(self, route, payload):
+        handler = ROUTES[route][0]
+        try:
+            with span("request", route=route):
+                return handler(payload)
+        finally:
+            flush_metrics()
+
+    def _release(self, route):
+        self.route_slots[route].release()
+        self.pending.release()
+
+    def call(self, route, payload, deadline=None):
+        # Returns (status, body). 503 when the service or the route has no free slot, 504 when the deadline
+        # passes first. Python threads cannot be killed, so a job that overran its deadline keeps its slot until
+        # it actually finishes; later calls to that route get 503 instead of piling up behind it.
+        if route not in ROUTES:
+            return 404, {"error": f"Unknown route {route}"}
+        if not self.pending.acquire(blocking=False):
+            return 503, {"error": "Analytics service is busy"}
+        if not self.route_slots[route].acquire(blocking=False):
+            self.pending.release()
+            return 503, {"error": f"{route} is busy"}
+        started = time.time()
+        try:
+            future = self.executors[route].submit(self._run, route, payload)
+            future.add_done_callback(lambda _: self._release(route))
+        except Exception:
+            self._release(route)
+            raise
+        try:
+            result = future.result(timeout=deadline or self.deadline)
+        except FutureTimeout:
+            logging.error(f"{route} exceeded its {deadline or self.deadline}s deadline; it keeps running until done")
+            return 504, {"error": "Deadline exceeded"}
+        except Exception as e:
+            logging.exception(f"{route} failed")
+            return 500, {"error": str(e)}
+        logging.info(f"{route} served in {time.time() - started:.2f}s")
+        return 200, result
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, payload):
+            deadline = self.headers.get("X-Deadline")
+            try:
+                deadline = float(deadline) if deadline else None
+            except ValueError:
+                deadline = None
+            self._send(*service.call(self.path.split("?")[0], payload, deadline))
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "loaded": sorted(_modules)})
+            else:
+                self._dispatch({})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self._send(413, {"error": "Request body too large"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except Exception as e:
+                self._send(400, {"error": f"Invalid JSON input: {str(e)}"})
+                return
+            self._dispatch(payload)
+
+        def log_message(self, format, *args):
+            logging.info("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+def main():
+    global STATIC_DIR
+    parser = argparse.ArgumentParser(description="Long-lived analytics service for the AL scripts")
+    parser.add_argument("--host", type=str, default=os.environ.get("ANALYTICS_HOST", SERVICE_HOST))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ANALYTICS_PORT", SERVICE_PORT)))
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Concurrent jobs per route (heavy routes stay at their own lower limit)")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING, help="Jobs running across all routes before 503")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="Default per-request deadline in seconds")
+    parser.add_argument("--static-dir", type=str, default=STATIC_DIR,
+                        help="Directory the Node server serves at /static; charts are written here")
+    parser.add_argument("--preload", type=str, default="", help="Comma-separated routes to warm up, or 'all'")
+    args = parser.parse_args()
+    STATIC_DIR = args.static_dir
+
+    service = AnalyticsService(args.workers, max(args.workers, args.max_pending), args.deadline)
+    if args.preload:
+        routes = list(ROUTES) if args.preload == "all" else ["/" + r.strip().lstrip("/") for r in args.preload.split(",")]
+        service.preload([r for r in routes if r in ROUTES])
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Analytics service listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import sys
+import time
+import random
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                   "AppleWebKit/537.36 (KHTML, like Gecko) "
+                   "Chrome/115.0.0.0 Safari/537.36"),
+    "Referer": "https://www.moneycontrol.com/"
+}
+
+MAX_WORKERS = 16
+PER_HOST_LIMIT = 4
+FETCH_DEADLINE = 45
+REQUEST_TIMEOUT = 10
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def make_session(pool_size=MAX_WORKERS, headers=None):
+    # One keep-alive pool per host, sized so every worker can hold a connection.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers or DEFAULT_HEADERS)
+    return session
+
+def _backoff_delay(attempt, backoff):
+    return backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+def _failed_page():
+    return {"status": 0, "text": "", "etag": None, "last_modified": None}
+
+def _conditional_headers(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+def _fetch_one(session, url, host_slots, stop_at, timeout, retries, backoff, validators=None):
+    host = urlparse(url).netloc
+    headers = _conditional_headers(validators)
+    for attempt in range(retries + 1):
+        remaining = stop_at - time.monotonic()
+        if remaining <= 0:
+            return _failed_page()
+        slot = host_slots[host]
+        if not slot.acquire(timeout=remaining):
+            return _failed_page()
+        try:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                return _failed_page()
+            response = session.get(url, timeout=min(timeout, remaining), headers=headers)
+            if response.status_code in (200, 304):
+                return {"status": response.status_code,
+                        "text": response.text if response.status_code == 200 else "",
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified")}
+            if response.status_code not in RETRY_STATUSES:
+                return _failed_page()
+        except requests.RequestException as e:
+            print("Fetch failed for", url, "-", e, file=sys.stderr)
+        finally:
+            slot.release()
+        if attempt < retries:
+            delay = _backoff_delay(attempt, backoff)
+            if time.monotonic() + delay >= stop_at:
+                return _failed_page()
+            time.sleep(delay)
+    return _failed_page()
+
+def fetch_articles(urls, **kwargs):
+    # Returns {url: html} for every input url; pages that failed or missed the deadline map to "".
+    return {url: page["text"] for url, page in fetch_pages(urls, **kwargs).items()}
+
+def fetch_pages(urls, validators=None, session=None, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT,
+                deadline=FETCH_DEADLINE, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, backoff=BACKOFF_BASE):
+    # Returns {url: {"status", "text", "etag", "last_modified"}}. validators maps url -> the etag/last_modified
+    # seen last time; those urls are fetched conditionally and come back with status 304 when unchanged.
+    # Failed or timed-out pages have status 0.
+    urls = list(dict.fromkeys(u for u in urls if u))
+    validators = validators or {}
+    results = {url: _failed_page() for url in urls}
+    if not urls:
+        return results
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max(max_workers, per_host_limit))
+    stop_at = time.monotonic() + deadline
+    hosts = {urlparse(url).netloc for url in urls}
+    host_slots = {host: threading.BoundedSemaphore(per_host_limit) for host in hosts}
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    try:
+        futures = {
+            executor.submit(_fetch_one, session, url, host_slots, stop_at, timeout, retries, backoff,
+                            validators.get(url)): url
+            for url in urls
+        }
+        done, not_done = wait(futures, timeout=max(0.0, stop_at - time.monotonic()))
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print("Fetch failed for", futures[future], "-", e, file=sys.stderr)
+        if not_done:
+            print(f"Fetch deadline reached, {len(not_done)} articles skipped", file=sys.stderr)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if own_session:
+            session.close()
+    return results
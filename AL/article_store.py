@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import time
+import json
+import hashlib
+
+ARTICLE_STORE_FILE = "article_store.json"
+ARTICLE_STORE_MAX_ENTRIES = 2000
+ARTICLE_STORE_MAX_BYTES = 50 * 1024 * 1024
+# Cached articles older than this are revalidated upstream (conditional GET, then a hash comparison).
+ARTICLE_REVALIDATE_AFTER = 3600
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _entry_is_valid(entry):
+    return (isinstance(entry, dict)
+            and isinstance(entry.get("text"), str)
+            and entry.get("hash") == content_hash(entry["text"])
+            and isinstance(entry.get("tickers"), list)
+            and isinstance(entry.get("sentiment"), (int, float)))
+
+def load_article_store(path=ARTICLE_STORE_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print("Ignoring unreadable article store:", e, file=sys.stderr)
+        return {}
+    # Entries whose text no longer matches its hash were truncated or edited; drop them so they get refetched.
+    return {url: entry for url, entry in data.get("articles", {}).items() if _entry_is_valid(entry)}
+
+def _evict(store, max_entries, max_bytes):
+    by_age = sorted(store, key=lambda url: store[url].get("seen", 0))
+    total_bytes = sum(len(entry["text"]) for entry in store.values())
+    for url in by_age:
+        if len(store) <= max_entries and total_bytes <= max_bytes:
+            break
+        total_bytes -= len(store[url]["text"])
+        del store[url]
+
+def save_article_store(store, path=ARTICLE_STORE_FILE, max_entries=ARTICLE_STORE_MAX_ENTRIES,
+                       max_bytes=ARTICLE_STORE_MAX_BYTES):
+    _evict(store, max_entries, max_bytes)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"articles": store}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print("Error saving article store:", e, file=sys.stderr)
+
+def lookup_article(store, url, tickers_key=None):
+    entry = store.get(url)
+    if entry is None:
+        return None
+    entry["seen"] = time.time()
+    if tickers_key is not None and entry.get("tickers_key") != tickers_key:
+        return dict(entry, tickers=None)
+    return entry
+
+def needs_revalidation(entry, max_age=ARTICLE_REVALIDATE_AFTER):
+    return time.time() - entry.get("fetched", 0) >= max_age
+
+def article_validators(entry):
+    return {"etag": entry.get("etag"), "last_modified": entry.get("last_modified")}
+
+def mark_revalidated(store, url, etag=None, last_modified=None):
+    # Upstream answered 304, or served a body whose text hashes the same as the stored one.
+    entry = store[url]
+    entry["fetched"] = time.time()
+    entry["etag"] = etag or entry.get("etag")
+    entry["last_modified"] = last_modified or entry.get("last_modified")
+    return entry
+
+def record_article(store, url, text, tickers, sentiment, tickers_key=None, ticker_sentiments=None,
+                   etag=None, last_modified=None):
+    entry = {
+        "hash": content_hash(text),
+        "text": text,
+        "tickers": list(tickers),
+        "tickers_key": tickers_key,
+        "sentiment": float(sentiment),
+        "ticker_sentiments": dict(ticker_sentiments or {}),
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched": time.time(),
+        "seen": time.time()
+    }
+    store[url] = entry
+    return entry
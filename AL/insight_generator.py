@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import time
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from instrumentation import span, cache_result
+
+GEMINI_MODEL_ID = "gemini-2.0-flash"
+INSIGHT_CACHE_FILE = "insights_cache.json"
+INSIGHT_CACHE_TTL = 6 * 3600
+INSIGHT_CACHE_MAX_ENTRIES = 500
+INSIGHT_DEADLINE = 30
+INSIGHT_WORKERS = 5
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, model_id=GEMINI_MODEL_ID, api_key=None):
+        api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY is not set.")
+        from google.generativeai import configure, GenerativeModel
+        configure(api_key=api_key)
+        self.name = f"gemini:{model_id}"
+        self.model = GenerativeModel(model_id)
+
+    def generate(self, prompt, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        with span("llm_call", backend=self.name):
+            response = self.model.generate_content(prompt, request_options=request_options)
+        return response.text.strip()
+
+class StubBackend:
+    # Local stand-in for tests and offline runs: canned responses by prompt, otherwise an echo.
+    name = "stub"
+
+    def __init__(self, responses=None, delay=0.0):
+        self.responses = dict(responses or {})
+        self.delay = delay
+        self.calls = []
+
+    def generate(self, prompt, timeout=None):
+        self.calls.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        return self.responses.get(prompt, "Stub insight: " + prompt[:80])
+
+def get_backend(name=None):
+    name = name or os.environ.get("INSIGHT_BACKEND", "gemini")
+    if name == "stub":
+        return StubBackend()
+    if name == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown insight backend: {name}")
+
+def prompt_key(backend, prompt):
+    return hashlib.sha256(f"{backend.name}\n{prompt}".encode("utf-8")).hexdigest()
+
+def load_insight_cache(path=INSIGHT_CACHE_FILE, ttl=INSIGHT_CACHE_TTL):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("insights", {})
+    except Exception as e:
+        print("Ignoring unreadable insight cache:", e, file=sys.stderr)
+        return {}
+    now = time.time()
+    return {key: entry for key, entry in entries.items() if now - entry.get("time", 0) < ttl}
+
+def save_insight_cache(cache, path=INSIGHT_CACHE_FILE, max_entries=INSIGHT_CACHE_MAX_ENTRIES):
+    newest = sorted(cache.items(), key=lambda item: item[1].get("time", 0), reverse=True)[:max_entries]
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"insights": dict(newest)}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print("Error saving insight cache:", e, file=sys.stderr)
+
+def generate_insight_texts(prompts, backend=None, cache_path=INSIGHT_CACHE_FILE, deadline=INSIGHT_DEADLINE,
+                           workers=INSIGHT_WORKERS):
+    # prompts maps ticker -> prompt. Cached answers are reused, the rest run concurrently;
+    # tickers whose call fails or misses the deadline are left out of the result.
+    backend = backend or get_backend()
+    cache = load_insight_cache(cache_path)
+    results = {}
+    pending = {}
+    for ticker, prompt in prompts.items():
+        key = prompt_key(backend, prompt)
+        cache_result("insight", key in cache)
+        if key in cache:
+            results[ticker] = cache[key]["text"]
+        else:
+            pending[ticker] = (key, prompt)
+    if pending:
+        stop_at = time.monotonic() + deadline
+        executor = ThreadPoolExecutor(max_workers=min(workers, len(pending)))
+        try:
+            futures = {executor.submit(backend.generate, prompt, deadline): ticker
+                       for ticker, (_, prompt) in pending.items()}
+            with span("llm", backend=backend.name):
+                done, not_done = wait(futures, timeout=max(0.0, stop_at - time.monotonic()))
+            for future in done:
+                ticker = futures[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f"Insight generation failed for {ticker}:", e, file=sys.stderr)
+                    continue
+                results[ticker] = text
+                cache[pending[ticker][0]] = {"text": text, "time": time.time()}
+            if not_done:
+                print(f"Insight deadline reached, {len(not_done)} tickers skipped", file=sys.stderr)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        save_insight_cache(cache, cache_path)
+    return {ticker: results[ticker] for ticker in prompts if ticker in results}
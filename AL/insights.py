@@ -5,42 +5,47 @@ import os
 import sys
 import time
 import json
+import pickle
 import requests
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from sklearn.preprocessing import MinMaxScaler
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-
-from google.generativeai import configure, GenerativeModel
-import google.generativeai as genai
-from bs4 import BeautifulSoup
+# TensorFlow, sklearn and bs4 are imported where they are used: sentiment pool workers re-import this
+# script as __mp_main__, and they must not pay for (or hold) a TensorFlow runtime.
 import re
 import warnings
 import io
 from contextlib import redirect_stdout
 from dotenv import load_dotenv
 
+from article_fetcher import DEFAULT_HEADERS, fetch_pages
+from article_store import (content_hash, load_article_store, save_article_store, lookup_article,
+                           record_article, needs_revalidation, article_validators, mark_revalidated)
+from ticker_matcher import TickerMatcher
+from sentiment import score_text, score_articles
+from insight_generator import get_backend, generate_insight_texts
+from instrumentation import span, cache_result, profiled
+from market_data import get_provider
+
 warnings.filterwarnings("ignore")
 load_dotenv()
 
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY is not set.")
-configure(api_key=GEMINI_API_KEY)
-model_id = "gemini-2.0-flash"
-model = GenerativeModel(model_id)
-
 CACHE_FILE = "articles_cache.json"
 CACHE_EXPIRY = 3600
 
+MODEL_DIR = "saved_models"
+SEQUENCE_LENGTH = 60
+TRAIN_EPOCHS = 10
+FINE_TUNE_EPOCHS = 3
+MAX_FINE_TUNE_DAYS = 20
+MAX_FINE_TUNES = 30
+SCALE_DRIFT_LIMIT = 0.25
+PREDICTION_DAYS = 10
+FORECAST_METHODS = ("autoregressive", "direct")
+
 def load_cached_articles():
     if os.path.exists(CACHE_FILE):
         mtime = os.path.getmtime(CACHE_FILE)
@@ -64,23 +69,20 @@ def save_cached_articles(articles):
 
 def get_moneycontrol_articles():
     cached = load_cached_articles()
+    cache_result("article_list", bool(cached))
     if cached is not None and len(cached) > 0:
         print("Using cached articles")
         return cached
 
     url = "https://www.moneycontrol.com/news/business/stocks/"
-    headers = {
-        "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/115.0.0.0 Safari/537.36"),
-        "Referer": "https://www.moneycontrol.com/"
-    }
     urls = []
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        with span("scraping", source="moneycontrol_index"):
+            response = requests.get(url, headers=DEFAULT_HEADERS, timeout=10)
         if response.status_code != 200:
             print("Non-200 response", response.status_code, file=sys.stderr)
             return []
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(response.text, 'html.parser')
         selectors = [
             {"tag": "ul", "attrs": {"class": "oceanNewsLst"}},
@@ -124,44 +126,107 @@ def get_moneycontrol_articles():
         print("Error scraping Moneycontrol articles:", e, file=sys.stderr)
         return []
 
+def parse_article_text(html):
+    if not html:
+        return ""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    paragraphs = soup.find_all("p")
+    if not paragraphs:
+        paragraphs = soup.find_all("div", class_="article_content")
+    return " ".join(p.get_text() for p in paragraphs)
+
 def get_article_text(article_url):
-    headers = {
-        "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/115.0.0.0 Safari/537.36"),
-        "Referer": "https://www.moneycontrol.com/"
-    }
     try:
-        response = requests.get(article_url, headers=headers, timeout=10)
+        response = requests.get(article_url, headers=DEFAULT_HEADERS, timeout=10)
         if response.status_code != 200:
             return ""
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = soup.find_all("p")
-        if not paragraphs:
-            paragraphs = soup.find_all("div", class_="article_content")
-        text = " ".join(p.get_text() for p in paragraphs)
-        return text
+        return parse_article_text(response.text)
     except Exception:
         return ""
 
+_ticker_matcher = None
+
+def get_ticker_matcher():
+    global _ticker_matcher
+    if _ticker_matcher is None:
+        _ticker_matcher = TickerMatcher(STOCK_TICKERS, STOCK_ALIASES)
+    return _ticker_matcher
+
+def find_stock_mentions(text):
+    return get_ticker_matcher().tickers(text)
+
 def extract_stock_mentions(article_url):
     text = get_article_text(article_url)
-    mentioned_tickers = [ticker for name, ticker in STOCK_TICKERS.items() if name in text]
-    return mentioned_tickers, text
+    return find_stock_mentions(text), text
 
 def perform_sentiment_analysis(text):
-    analyzer = SentimentIntensityAnalyzer()
-    return analyzer.polarity_scores(text)["compound"]
+    return score_text(text)
+
+def tickers_fingerprint():
+    return content_hash(json.dumps([STOCK_TICKERS, STOCK_ALIASES], sort_keys=True))
 
 def get_trending_stock_sentiments():
     articles = get_moneycontrol_articles()
+    store = load_article_store()
+    tickers_key = tickers_fingerprint()
+    processed = {}
+    pending = []
+    stale = {}
+    to_score = []
+    for article in articles:
+        entry = lookup_article(store, article, tickers_key)
+        cache_result("article_store", entry is not None and not needs_revalidation(entry))
+        if entry is None:
+            pending.append(article)
+        elif needs_revalidation(entry):
+            stale[article] = entry
+            pending.append(article)
+        elif entry["tickers"] is None:
+            to_score.append((article, entry["text"]))
+        else:
+            processed[article] = entry
+    print(f"Article store: {len(processed)} cached, {len(pending)} to fetch "
+          f"({len(stale)} revalidating), {len(to_score)} to rescore")
+    fetched = {}
+    with span("scraping", source="articles"):
+        pages = fetch_pages(pending, validators={article: article_validators(entry) for article, entry in stale.items()})
+        for article in pending:
+            page = pages[article]
+            entry = stale.get(article)
+            text = parse_article_text(page["text"]) if page["text"] else ""
+            if entry is not None and (page["status"] in (0, 304) or content_hash(text) == entry["hash"]):
+                # Unchanged upstream (or unreachable right now): keep the stored text and scores.
+                if page["status"]:
+                    mark_revalidated(store, article, page["etag"], page["last_modified"])
+                if entry["tickers"] is None:
+                    to_score.append((article, entry["text"]))
+                else:
+                    processed[article] = entry
+            elif text:
+                fetched[article] = page
+                to_score.append((article, text))
+    matcher = get_ticker_matcher()
+    with span("sentiment"):
+        mentions = [matcher.find_all(text) for _, text in to_score]
+        scores = score_articles([(text, found) for (_, text), found in zip(to_score, mentions)])
+    for (article, text), found, score in zip(to_score, mentions, scores):
+        tickers = list(dict.fromkeys(ticker for _, _, ticker in found))
+        page = fetched.get(article)
+        if page is None:
+            previous = store.get(article, {})
+            page = {"etag": previous.get("etag"), "last_modified": previous.get("last_modified")}
+        processed[article] = record_article(store, article, text, tickers, score["compound"],
+                                            tickers_key, score["tickers"], page["etag"], page["last_modified"])
+    save_article_store(store)
     stock_sentiments = {}
     for article in articles:
-        tickers, text = extract_stock_mentions(article)
-        if not text:
+        entry = processed.get(article)
+        if entry is None or not entry["text"]:
             continue
-        sentiment_score = perform_sentiment_analysis(text)
-        for ticker in tickers:
+        ticker_scores = entry.get("ticker_sentiments") or {}
+        for ticker in entry["tickers"]:
+            sentiment_score = ticker_scores.get(ticker, entry["sentiment"])
             if ticker in stock_sentiments:
                 stock_sentiments[ticker]["total"] += sentiment_score
                 stock_sentiments[ticker]["count"] += 1
@@ -173,20 +238,31 @@ def get_trending_stock_sentiments():
     trending = sorted(avg_sentiments.items(), key=lambda x: x[1], reverse=True)
     return trending
 
+def get_stock_history(ticker):
+    stock = get_provider().history(ticker + ".NS", period="1y", interval="1d")
+    return stock["Close"].dropna()
+
 def get_stock_data(ticker):
-    stock = yf.download(ticker + ".NS", period="1y", interval="1d")
-    return stock["Close"].values.reshape(-1, 1)
+    return get_stock_history(ticker).values.reshape(-1, 1)
 
-def prepare_data(data, sequence_length=60):
+def prepare_data(data, sequence_length=SEQUENCE_LENGTH, horizon=1):
+    from sklearn.preprocessing import MinMaxScaler
     scaler = MinMaxScaler(feature_range=(0, 1))
     data_scaled = scaler.fit_transform(data)
+    X, y = make_sequences(data_scaled, sequence_length, horizon=horizon)
+    return X, y, scaler
+
+def make_sequences(data_scaled, sequence_length=SEQUENCE_LENGTH, start=None, horizon=1):
+    # Window i predicts data_scaled[i:i+horizon]; start skips windows whose targets begin earlier.
     X, y = [], []
-    for i in range(sequence_length, len(data_scaled)):
+    for i in range(max(sequence_length, start or 0), len(data_scaled) - horizon + 1):
         X.append(data_scaled[i-sequence_length:i, 0])
-        y.append(data_scaled[i, 0])
-    return np.array(X).reshape(-1, sequence_length, 1), np.array(y), scaler
+        y.append(data_scaled[i:i+horizon, 0])
+    return np.array(X).reshape(-1, sequence_length, 1), np.array(y).reshape(-1, horizon)
 
-def build_lstm_model(sequence_length=60):
+def build_lstm_model(sequence_length=SEQUENCE_LENGTH, horizon=1):
+    import tensorflow as tf
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
     inputs = tf.keras.Input(shape=(sequence_length, 1))
     x = LSTM(50, return_sequences=True)(inputs)
     x = Dropout(0.2)(x)
@@ -194,35 +270,108 @@ def build_lstm_model(sequence_length=60):
     x = Dropout(0.2)(x)
     x = LSTM(50)(x)
     x = Dropout(0.2)(x)
-    outputs = Dense(1)(x)
+    outputs = Dense(horizon)(x)
     model = tf.keras.Model(inputs, outputs)
     model.compile(optimizer="adam", loss="mean_squared_error")
     return model
 
-def predict_stock_price(ticker):
-    data = get_stock_data(ticker)
-    if len(data) < 60:
-        return None
-    X, y, scaler = prepare_data(data)
+def _price_model_paths(ticker, horizon=1):
+    suffix = "" if horizon == 1 else f"_direct{horizon}"
+    base = os.path.join(MODEL_DIR, f"{ticker}_insights{suffix}")
+    return base + "_lstm.keras", base + "_scaler.pkl", base + "_meta.pkl"
+
+def load_price_model(ticker, horizon=1):
+    model_path, scaler_path, meta_path = _price_model_paths(ticker, horizon)
+    if not all(os.path.exists(p) for p in (model_path, scaler_path, meta_path)):
+        return None, None, None
+    try:
+        from tensorflow.keras.models import load_model
+        lstm_model = load_model(model_path)
+        with open(scaler_path, "rb") as f:
+            scaler = pickle.load(f)
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+        return lstm_model, scaler, meta
+    except Exception as e:
+        print(f"Error loading cached model for {ticker}:", e, file=sys.stderr)
+        return None, None, None
+
+def save_price_model(ticker, lstm_model, scaler, meta, horizon=1):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path, scaler_path, meta_path = _price_model_paths(ticker, horizon)
+    lstm_model.save(model_path)
+    with open(scaler_path, "wb") as f:
+        pickle.dump(scaler, f)
+    with open(meta_path, "wb") as f:
+        pickle.dump(meta, f)
+
+def train_price_model(ticker, history, horizon=1):
+    data = history.values.reshape(-1, 1)
+    X, y, scaler = prepare_data(data, horizon=horizon)
     train_size = int(len(X) * 0.8)
     X_train, y_train = X[:train_size], y[:train_size]
     X_test, y_test = X[train_size:], y[train_size:]
-    lstm_model = build_lstm_model()
-    lstm_model.fit(X_train, y_train, epochs=10, batch_size=32, validation_data=(X_test, y_test), verbose=0)
-    last_sequence = X[-1]
+    lstm_model = build_lstm_model(horizon=horizon)
+    with span("training", model="insights_lstm", mode="full"):
+        lstm_model.fit(X_train, y_train, epochs=TRAIN_EPOCHS, batch_size=32, validation_data=(X_test, y_test), verbose=0)
+    meta = {"last_date": history.index[-1], "fine_tunes": 0}
+    save_price_model(ticker, lstm_model, scaler, meta, horizon)
+    return lstm_model, scaler
+
+def get_price_model(ticker, history, horizon=1):
+    # Reuse the saved model while no new trading days have arrived, fine-tune it on the days that did,
+    # and only fall back to a full retrain when the gap or the price range drift gets too large.
+    lstm_model, scaler, meta = load_price_model(ticker, horizon)
+    cache_result("insights_model", lstm_model is not None)
+    if lstm_model is None:
+        return train_price_model(ticker, history, horizon)
+    last_date = meta.get("last_date")
+    if last_date not in history.index:
+        return train_price_model(ticker, history, horizon)
+    new_days = int((history.index > last_date).sum())
+    if new_days == 0:
+        return lstm_model, scaler
+    if new_days > MAX_FINE_TUNE_DAYS or meta.get("fine_tunes", 0) >= MAX_FINE_TUNES:
+        return train_price_model(ticker, history, horizon)
+    data_scaled = scaler.transform(history.values.reshape(-1, 1))
+    recent = data_scaled[-new_days:]
+    if recent.min() < -SCALE_DRIFT_LIMIT or recent.max() > 1 + SCALE_DRIFT_LIMIT:
+        return train_price_model(ticker, history, horizon)
+    X_new, y_new = make_sequences(data_scaled, start=len(data_scaled) - new_days - horizon + 1, horizon=horizon)
+    if len(X_new):
+        with span("training", model="insights_lstm", mode="fine_tune"):
+            lstm_model.fit(X_new, y_new, epochs=FINE_TUNE_EPOCHS, batch_size=32, verbose=0)
+    meta = {"last_date": history.index[-1], "fine_tunes": meta.get("fine_tunes", 0) + 1}
+    save_price_model(ticker, lstm_model, scaler, meta, horizon)
+    return lstm_model, scaler
+
+def predict_stock_price(ticker, method="autoregressive"):
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method: {method}")
+    horizon = PREDICTION_DAYS if method == "direct" else 1
+    history = get_stock_history(ticker)
+    if len(history) <= SEQUENCE_LENGTH + horizon - 1:
+        return None
+    lstm_model, scaler = get_price_model(ticker, history, horizon)
+    last_sequence = scaler.transform(history.values.reshape(-1, 1))[-SEQUENCE_LENGTH:]
+    if method == "direct":
+        with span("inference", model="insights_lstm_direct"):
+            future_prices = lstm_model.predict(np.array([last_sequence]), verbose=0)[0]
+        return scaler.inverse_transform(future_prices.reshape(-1, 1)).flatten()
     future_prices = []
-    for _ in range(10):
-        next_price = lstm_model.predict(np.array([last_sequence]), verbose=0)[0][0]
-        future_prices.append(next_price)
-        last_sequence = np.append(last_sequence[1:], [[next_price]], axis=0)
+    with span("inference", model="insights_lstm"):
+        for _ in range(PREDICTION_DAYS):
+            next_price = lstm_model.predict(np.array([last_sequence]), verbose=0)[0][0]
+            future_prices.append(next_price)
+            last_sequence = np.append(last_sequence[1:], [[next_price]], axis=0)
     return scaler.inverse_transform(np.array(future_prices).reshape(-1, 1)).flatten()
 
 def generate_insights(stock, sentiment_score, predicted_prices):
     avg_future_price = np.mean(predicted_prices)
-    df = yf.download(stock + ".NS", period="1d")
-    if "Adj Close" in df.columns:
+    df = get_provider().history(stock + ".NS", period="1d")
+    if "Adj Close" in df.columns and not df.empty:
         current_price = df["Adj Close"].values[0]
-    elif "Close" in df.columns:
+    elif "Close" in df.columns and not df.empty:
         current_price = df["Close"].values[0]
     else:
         raise ValueError("No price data available for " + stock)
@@ -236,10 +385,9 @@ def generate_insights(stock, sentiment_score, predicted_prices):
         return "Hold"
 
 def get_historical_data(ticker):
-    stock = yf.Ticker(ticker + ".NS")
-    return stock.history(period="6mo")
+    return get_provider().history(ticker + ".NS", period="6mo")
 
-def generate_gemini_insight(ticker, sentiment_score, predicted_prices, historical_data):
+def build_insight_prompt(ticker, sentiment_score, predicted_prices, historical_data):
     last_price = historical_data["Close"].iloc[-1]
     avg_volume = historical_data["Volume"].mean()
     last_predicted_price = predicted_prices[-1]
@@ -250,8 +398,11 @@ def generate_gemini_insight(ticker, sentiment_score, predicted_prices, historica
         f"LSTM model predicts a {predicted_trend} trend with a future price of ₹{last_predicted_price:.2f}. "
         f"Give a one-line investment insight."
     )
-    gemini_response = model.generate_content(prompt)
-    return gemini_response.text.strip()
+    return prompt
+
+def generate_gemini_insight(ticker, sentiment_score, predicted_prices, historical_data, backend=None):
+    prompt = build_insight_prompt(ticker, sentiment_score, predicted_prices, historical_data)
+    return generate_insight_texts({ticker: prompt}, backend=backend).get(ticker, "")
 
 STOCK_TICKERS = {
     "HDFC Bank": "HDFCBANK", "ICICI Bank": "ICICIBANK", "State Bank of India": "SBIN",
@@ -287,18 +438,39 @@ STOCK_TICKERS = {
     "Adani Power": "ADANIPOWER", "Adani Total Gas": "ATGL", "Adani Wilmar": "AWL"
 }
 
-def main():
+STOCK_ALIASES = {
+    "HDFC Bank Ltd": "HDFCBANK", "ICICI": "ICICIBANK", "SBI": "SBIN", "Kotak Bank": "KOTAKBANK",
+    "Kotak Mahindra": "KOTAKBANK", "IndusInd": "INDUSINDBK", "PNB": "PNB", "BoB": "BANKBARODA",
+    "IDFC First": "IDFCFIRSTB", "SBI Life": "SBILIFE", "HDFC Life": "HDFCLIFE", "ICICI Pru Life": "ICICIPRULI",
+    "TCS": "TCS", "Infy": "INFY", "HCL Tech": "HCLTECH", "HCLTech": "HCLTECH", "LTI Mindtree": "LTIM",
+    "L&T Tech": "LTTS", "LTTS": "LTTS", "Mphasis": "MPHASIS", "RIL": "RELIANCE",
+    "IOC": "IOC", "IOCL": "IOC", "Indian Oil": "IOC", "BPCL": "BPCL", "HPCL": "HPCL", "GAIL": "GAIL",
+    "Power Grid": "POWERGRID", "Adani Green": "ADANIGREEN", "Maruti": "MARUTI", "M&M": "M&M",
+    "Mahindra and Mahindra": "M&M", "Hero Moto": "HEROMOTOCO", "Eicher": "EICHERMOT", "TVS Motors": "TVSMOTOR",
+    "HUL": "HINDUNILVR", "Nestle": "NESTLEIND", "Dabur": "DABUR", "Britannia": "BRITANNIA",
+    "Godrej Consumer Products": "GODREJCP", "Colgate": "COLPAL", "Dr Reddy's": "DRREDDY",
+    "Dr. Reddy's": "DRREDDY", "Aurobindo": "AUROPHARMA", "Torrent Pharmaceuticals": "TORNTPHARM",
+    "Divi's Labs": "DIVISLAB", "Glenmark": "GLENMARK", "Hindalco": "HINDALCO",
+    "Jindal Steel": "JINDALSTEL", "L&T": "LT", "Larsen and Toubro": "LT", "Grasim": "GRASIM",
+    "UltraTech": "ULTRACEMCO", "Ambuja": "AMBUJACEM", "Airtel": "BHARTIARTL",
+    "Zee": "ZEEL", "DMart": "DMART", "D-Mart": "DMART", "ABFRL": "ABFRL", "IndiGo": "INDIGO",
+    "Concor": "CONCOR", "Blue Dart": "BLUEDART", "Adani Ports and SEZ": "ADANIPORTS",
+    "Adani Total": "ATGL"
+}
+
+def main(backend=None):
+    backend = backend or get_backend()
     top_trending_stocks = get_trending_stock_sentiments()[:5]
-    insights = {}
+    prompts = {}
     for ticker, sentiment_score in top_trending_stocks:
         historical_data = get_historical_data(ticker)
         predicted_prices = predict_stock_price(ticker)
         if predicted_prices is not None:
-            insights[ticker] = generate_gemini_insight(ticker, sentiment_score, predicted_prices, historical_data)
-    return insights
+            prompts[ticker] = build_insight_prompt(ticker, sentiment_score, predicted_prices, historical_data)
+    return generate_insight_texts(prompts, backend=backend)
 
 if __name__ == "__main__":
     dummy_stdout = io.StringIO()
-    with redirect_stdout(dummy_stdout):
+    with redirect_stdout(dummy_stdout), profiled("insights"), span("request", script="insights"):
         result = main()
     print(json.dumps(result, indent=2))
\ No newline at end of file
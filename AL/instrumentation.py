@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Recording is opt-in with AL_METRICS=1. Output goes to AL_METRICS_DIR/<script>.jsonl (one line per span) or,
+# with AL_METRICS_FORMAT=prometheus, to AL_METRICS_DIR/<script>.prom, a textfile rewritten on flush with this
+# process's totals - only meaningful for the long-lived analytics service, since each short CLI run would
+# replace it with its own counters. AL_METRICS_FILE overrides the path; AL_PROFILE=<dir> dumps a cProfile .prof
+# per profiled entry point.
+METRICS_ENABLED = os.environ.get("AL_METRICS", "0") not in ("", "0")
+METRICS_FORMAT = os.environ.get("AL_METRICS_FORMAT", "json")
+METRICS_DIR = os.environ.get("AL_METRICS_DIR", "metrics")
+_entry = sys.argv[0] if sys.argv and sys.argv[0] not in ("", "-c", "-m") else "python"
+SCRIPT_NAME = os.path.splitext(os.path.basename(_entry))[0]
+METRICS_FILE = os.environ.get("AL_METRICS_FILE", os.path.join(
+    METRICS_DIR, SCRIPT_NAME + (".prom" if METRICS_FORMAT == "prometheus" else ".jsonl")))
+PROFILE_DIR = os.environ.get("AL_PROFILE")
+
+_lock = threading.Lock()
+_stage_totals = {}
+_event_totals = {}
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _ensure_metrics_dir():
+    directory = os.path.dirname(METRICS_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+def _write_json(record):
+    try:
+        _ensure_metrics_dir()
+        with open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except Exception as e:
+        print("Error writing metrics:", e, file=sys.stderr)
+
+def record_span(stage, seconds, ok=True, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (stage, _label_key(labels))
+    with _lock:
+        totals = _stage_totals.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0})
+        totals["count"] += 1
+        totals["sum"] += seconds
+        totals["max"] = max(totals["max"], seconds)
+        if not ok:
+            totals["errors"] += 1
+        if METRICS_FORMAT == "json":
+            _write_json({"ts": time.time(), "pid": os.getpid(), "type": "span", "stage": stage,
+                         "seconds": round(seconds, 6), "ok": ok, "labels": labels,
+                         "peak_rss_bytes": peak_rss_bytes()})
+
+def record_event(event, **labels):
+    # Counters such as cache hit/miss: record_event("cache", cache="prices", result="hit").
+    if not METRICS_ENABLED:
+        return
+    key = (event, _label_key(labels))
+    with _lock:
+        _event_totals[key] = _event_totals.get(key, 0) + 1
+        if METRICS_FORMAT == "json":
+            _write_json({"ts": time.time(), "pid": os.getpid(), "type": "event", "event": event, "labels": labels})
+
+def cache_result(cache, hit):
+    record_event("cache", cache=cache, result="hit" if hit else "miss")
+
+@contextmanager
+def span(stage, **labels):
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started, ok, **labels)
+
+@contextmanager
+def profiled(name):
+    if not PROFILE_DIR:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}-{int(time.time())}.prof"))
+
+def _prom_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs) + "}"
+
+def prometheus_text():
+    lines = [
+        "# TYPE al_stage_seconds summary",
+        "# TYPE al_stage_seconds_max gauge",
+        "# TYPE al_stage_errors_total counter",
+        "# TYPE al_events_total counter",
+        "# TYPE al_peak_rss_bytes gauge",
+    ]
+    with _lock:
+        for (stage, labels), totals in sorted(_stage_totals.items()):
+            tag = _prom_labels((("stage", stage),) + labels)
+            lines.append(f"al_stage_seconds_sum{tag} {totals['sum']:.6f}")
+            lines.append(f"al_stage_seconds_count{tag} {totals['count']}")
+            lines.append(f"al_stage_seconds_max{tag} {totals['max']:.6f}")
+            lines.append(f"al_stage_errors_total{tag} {totals['errors']}")
+        for (event, labels), total in sorted(_event_totals.items()):
+            lines.append(f"al_events_total{_prom_labels((('event', event),) + labels)} {total}")
+    lines.append(f"al_peak_rss_bytes{_prom_labels((('pid', str(os.getpid())),))} {peak_rss_bytes()}")
+    return "\n".join(lines) + "\n"
+
+def flush():
+    if not METRICS_ENABLED:
+        return
+    if METRICS_FORMAT == "prometheus":
+        tmp_path = METRICS_FILE + ".tmp"
+        try:
+            _ensure_metrics_dir()
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(prometheus_text())
+            os.replace(tmp_path, METRICS_FILE)
+        except Exception as e:
+            print("Error writing metrics:", e, file=sys.stderr)
+    else:
+        _write_json({"ts": time.time(), "pid": os.getpid(), "type": "process",
+                     "peak_rss_bytes": peak_rss_bytes()})
+
+atexit.register(flush)
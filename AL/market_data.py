@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import glob
+import json
+import time
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from instrumentation import span, record_event
+
+# MARKET_DATA_BACKEND picks the provider for every script: "yahoo", "alphavantage" or "replay" (offline,
+# serves the cache/ pickles). Scripts that pass an explicit name still honour the override.
+MARKET_DATA_BACKEND = os.environ.get("MARKET_DATA_BACKEND")
+REPLAY_DIR = os.environ.get("MARKET_DATA_REPLAY_DIR", "cache")
+ALPHA_VANTAGE_API_KEY = os.environ.get("ALPHA_VANTAGE_API_KEY", "YOUR_API_KEY_HERE")
+RATE_STATE_DIR = os.environ.get("MARKET_DATA_STATE_DIR", "cache")
+# (calls, seconds) per provider. Yahoo has no published quota, so this only smooths bursts within a process.
+YAHOO_RATE_LIMIT = (4, 1.0)
+YAHOO_BULK_SIZE = 50
+# Longest a caller waits on a fetch another thread already started before treating the ticker as failed.
+FETCH_WAIT_TIMEOUT = 600
+# The free Alpha Vantage tier allows 5 calls a minute per key, shared by every process on the machine.
+ALPHA_VANTAGE_RATE_LIMIT = (5, 60.0)
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653}
+
+def period_start(period, end=None):
+    if period in (None, "max", "ytd") or period not in PERIOD_DAYS:
+        return None
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize()
+    return end - pd.Timedelta(days=PERIOD_DAYS[period])
+
+def normalize_frame(df, ticker=None):
+    # yf.download returns (Price, Ticker) columns for one ticker; callers get plain Open/High/Low/Close/Volume.
+    if df is None or df.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker is not None and ticker in df.columns.get_level_values(-1):
+            df = df.xs(ticker, axis=1, level=-1)
+        elif ticker is not None and ticker in df.columns.get_level_values(0):
+            df = df[ticker]
+        else:
+            df = df.droplevel(-1, axis=1)
+    df = df.loc[:, ~df.columns.duplicated()]
+    if getattr(df.index, "tz", None) is not None:
+        df.index = df.index.tz_localize(None)
+    df.index.name = "Date"
+    df.columns.name = None
+    return df.dropna(how="all").sort_index()
+
+class RateLimiter:
+    # At most `calls` upstream calls in any `period` seconds: calls go through immediately until the window is
+    # full, then wait for the oldest one to age out. With state_path the window lives in an flock-ed file, so
+    # separate CLI processes draw from the same budget; without fcntl it falls back to this process only.
+    def __init__(self, calls, period, state_path=None):
+        self.calls = calls
+        self.period = period
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._stamps = []
+
+    def _reserve(self, stamps, now):
+        stamps = sorted(t for t in stamps if now - t < self.period)
+        if len(stamps) < self.calls:
+            return stamps + [now], 0.0
+        return stamps, stamps[-self.calls] + self.period - now
+
+    def _reserve_shared(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.state_path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    stamps = json.loads(f.read() or "[]")
+                except ValueError:
+                    stamps = []
+                stamps, wait = self._reserve(stamps, time.time())
+                if wait <= 0:
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(stamps, f)
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self):
+        # Returns True when the caller had to wait.
+        waited = False
+        while True:
+            with self._lock:
+                if self.state_path:
+                    wait = self._reserve_shared()
+                else:
+                    self._stamps, wait = self._reserve(self._stamps, time.time())
+            if wait <= 0:
+                return waited
+            waited = True
+            time.sleep(wait)
+
+class MarketDataProvider:
+    name = "base"
+    rate_limit = None
+    shared_rate_limit = False
+    bulk_size = 1
+
+    def __init__(self, rate_limit=None):
+        rate_limit = rate_limit or self.rate_limit
+        state_path = os.path.join(RATE_STATE_DIR, f".{self.name}_rate.json") if self.shared_rate_limit else None
+        self._limiter = RateLimiter(*rate_limit, state_path=state_path) if rate_limit else None
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _throttle(self):
+        if self._limiter is not None and self._limiter.acquire():
+            record_event("rate_limited", provider=self.name)
+
+    def _fetch(self, ticker, period, interval, start, end):
+        raise NotImplementedError
+
+    def _fetch_many(self, tickers, period, interval, start, end):
+        return {ticker: self._fetch(ticker, period, interval, start, end) for ticker in tickers}
+
+    def _resolve(self, owned, tickers, key, frames, error):
+        # Every owned future is taken out of _inflight and completed, so no waiter is left hanging.
+        with self._inflight_lock:
+            for ticker in tickers:
+                if self._inflight.get((ticker,) + key) is owned[ticker]:
+                    del self._inflight[(ticker,) + key]
+        for ticker in tickers:
+            future = owned[ticker]
+            if future.done():
+                continue
+            if ticker not in frames:
+                future.set_exception(error or KeyError(f"No data returned for {ticker}"))
+                continue
+            try:
+                future.set_result(normalize_frame(frames[ticker], ticker))
+            except Exception as e:
+                future.set_exception(e)
+
+    def bulk_history(self, tickers, period="1y", interval="1d", start=None, end=None):
+        # Identical requests already in flight are awaited rather than repeated; the rest go out in
+        # batches of bulk_size. Tickers that fail map to an empty frame and are logged.
+        tickers = list(dict.fromkeys(tickers))
+        key = (period, interval, start, end)
+        waiting, owned = {}, {}
+        with self._inflight_lock:
+            for ticker in tickers:
+                future = self._inflight.get((ticker,) + key)
+                if future is None:
+                    future = Future()
+                    self._inflight[(ticker,) + key] = future
+                    owned[ticker] = future
+                else:
+                    record_event("coalesced", provider=self.name)
+                waiting[ticker] = future
+        pending = list(owned)
+        try:
+            for i in range(0, len(pending), self.bulk_size):
+                batch = pending[i:i + self.bulk_size]
+                try:
+                    self._throttle()
+                    with span("data_fetch", source=self.name):
+                        frames = self._fetch_many(batch, period, interval, start, end)
+                    error = None
+                except Exception as e:
+                    frames, error = {}, e
+                self._resolve(owned, batch, key, frames, error)
+        finally:
+            # Reached with futures still open only when something like KeyboardInterrupt cut the loop short.
+            self._resolve(owned, pending, key, {}, RuntimeError(f"{self.name}: fetch was interrupted"))
+        results = {}
+        deadline = time.monotonic() + FETCH_WAIT_TIMEOUT
+        for ticker in tickers:
+            try:
+                results[ticker] = waiting[ticker].result(timeout=max(0.0, deadline - time.monotonic())).copy()
+            except FutureTimeout:
+                print(f"{self.name}: gave up waiting for {ticker} after {FETCH_WAIT_TIMEOUT}s", file=sys.stderr)
+                results[ticker] = normalize_frame(None)
+            except Exception as e:
+                print(f"{self.name}: error fetching {ticker}:", e, file=sys.stderr)
+                results[ticker] = normalize_frame(None)
+        return results
+
+    def history(self, ticker, period="1y", interval="1d", start=None, end=None):
+        return self.bulk_history([ticker], period, interval, start, end)[ticker]
+
+    def info(self, ticker):
+        return {}
+
+class YahooProvider(MarketDataProvider):
+    name = "yahoo"
+    rate_limit = YAHOO_RATE_LIMIT
+    bulk_size = YAHOO_BULK_SIZE
+
+    def _download_args(self, period, interval, start, end):
+        if start is not None or end is not None:
+            return {"start": start, "end": end, "interval": interval}
+        return {"period": period, "interval": interval}
+
+    def _fetch(self, ticker, period, interval, start, end):
+        import yfinance as yf
+        return yf.download(ticker, progress=False, **self._download_args(period, interval, start, end))
+
+    def _fetch_many(self, tickers, period, interval, start, end):
+        if len(tickers) == 1:
+            return {tickers[0]: self._fetch(tickers[0], period, interval, start, end)}
+        import yfinance as yf
+        df = yf.download(tickers, group_by="ticker", progress=False, threads=True,
+                         **self._download_args(period, interval, start, end))
+        return {ticker: df[ticker] for ticker in tickers if ticker in df.columns.get_level_values(0)}
+
+    def info(self, ticker):
+        import yfinance as yf
+        self._throttle()
+        with span("data_fetch", source="yahoo_info"):
+            return yf.Ticker(ticker).info
+
+class AlphaVantageProvider(MarketDataProvider):
+    name = "alphavantage"
+    rate_limit = ALPHA_VANTAGE_RATE_LIMIT
+    shared_rate_limit = True
+
+    def __init__(self, api_key=None, rate_limit=None):
+        super().__init__(rate_limit)
+        self.api_key = api_key or ALPHA_VANTAGE_API_KEY
+
+    def _fetch(self, ticker, period, interval, start, end):
+        if interval != "1d":
+            raise ValueError(f"Alpha Vantage provider only serves daily bars, not {interval}")
+        from alpha_vantage.timeseries import TimeSeries
+        ts = TimeSeries(key=self.api_key, output_format='pandas', indexing_type='date')
+        data, _ = ts.get_daily(symbol=ticker, outputsize='full')
+        data = data.rename(columns={"1. open": "Open", "2. high": "High", "3. low": "Low",
+                                    "4. close": "Close", "5. volume": "Volume"}).sort_index()
+        start = pd.Timestamp(start) if start is not None else period_start(period, end)
+        if start is not None:
+            data = data[data.index >= start]
+        if end is not None:
+            data = data[data.index < pd.Timestamp(end)]
+        return data
+
+class ReplayProvider(MarketDataProvider):
+    # Serves cache/<TICKER>_<period>_<interval>.pkl without touching the network. A missing period falls back
+    # to the longest cached history for that ticker, trimmed to the requested window.
+    name = "replay"
+
+    def __init__(self, cache_dir=REPLAY_DIR, rate_limit=None):
+        super().__init__(rate_limit)
+        self.cache_dir = cache_dir
+
+    def _candidates(self, ticker, interval):
+        paths = glob.glob(os.path.join(self.cache_dir, glob.escape(ticker) + f"_*_{interval}.pkl"))
+        by_period = {}
+        for path in paths:
+            period = os.path.basename(path)[len(ticker) + 1:-len(f"_{interval}.pkl")]
+            by_period[period] = path
+        return by_period
+
+    def _fetch(self, ticker, period, interval, start, end):
+        by_period = self._candidates(ticker, interval)
+        if not by_period:
+            raise FileNotFoundError(f"No replay data for {ticker} ({interval}) in {self.cache_dir}")
+        exact = start is None and end is None and period in by_period
+        path = by_period[period] if exact else max(by_period.items(), key=lambda item: PERIOD_DAYS.get(item[0], 0))[1]
+        df = normalize_frame(pd.read_pickle(path), ticker)
+        if exact:
+            return df
+        if start is not None or end is not None:
+            if start is not None:
+                df = df[df.index >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df.index < pd.Timestamp(end)]
+            return df
+        # Replayed windows are anchored at the last cached bar, not today.
+        cutoff = period_start(period, df.index[-1]) if not df.empty else None
+        if period == "1d":
+            return df.tail(1)
+        return df[df.index > cutoff] if cutoff is not None else df
+
+PROVIDERS = {"yahoo": YahooProvider, "alphavantage": AlphaVantageProvider, "replay": ReplayProvider}
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_provider(name=None):
+    # One shared instance per backend per process, so coalescing and rate limits span every caller.
+    name = MARKET_DATA_BACKEND or name or "yahoo"
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown market data backend: {name}")
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name]()
+        return _providers[name]
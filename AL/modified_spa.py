@@ -1,7 +1,6 @@
 import sys
 import os
 import io
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,13 +11,14 @@ from datetime import datetime, timedelta
 import warnings
 from contextlib import redirect_stdout
 
+from instrumentation import span, profiled
+from market_data import get_provider
+from price_matrix import get_price_matrix
+
 
 warnings.filterwarnings("ignore")
 warnings.filterwarnings("ignore", module="yfinance")
 
-sys.stderr = open(os.devnull, "w")
-
-
 LOG_FILE = "modified_spy.log"
 logging.basicConfig(
     filename=LOG_FILE,
@@ -28,15 +28,27 @@ logging.basicConfig(
 logger = logging.getLogger()
 
 
-capture_buffer = io.StringIO()
-with redirect_stdout(capture_buffer):
+def load_close_prices(tickers, start_date, end_date):
+    # Reads from the shared price matrix, or straight from the provider when the matrix is unavailable.
     try:
-        investments = json.loads(sys.argv[1])
-        logger.info("Loaded investments from command-line argument.")
+        prices = get_price_matrix(tickers, period="1y")
     except Exception as e:
-        logger.error(f"Error loading investments: {e}")
-        sys.exit(1)
-
+        logger.error(f"Price matrix unavailable: {e}")
+        prices = None
+    if prices is not None:
+        frames = {ticker: prices.series(ticker, start_date, end_date) for ticker in tickers if ticker in prices}
+    else:
+        frames = {ticker: df["Close"] for ticker, df in
+                  get_provider().bulk_history(tickers, start=start_date, end=end_date).items() if not df.empty}
+    missing = [ticker for ticker in tickers if ticker not in frames]
+    if missing:
+        raise ValueError(f"No price data for {', '.join(missing)}")
+    return pd.concat({ticker: frames[ticker] for ticker in tickers}, axis=1).dropna()
+
+
+def analyze_portfolio(investments, fig_dir="static", url_prefix=None):
+    # Charts are written to fig_dir; the returned paths use url_prefix (default fig_dir) as the caller serves them.
+    url_prefix = url_prefix or fig_dir
     tickers = [item['ticker'] for item in investments]
     weights = {item['ticker']: item['weight'] for item in investments}
     total_investment = sum(weights.values())
@@ -47,16 +59,11 @@ with redirect_stdout(capture_buffer):
     start_date = (datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d')
 
     try:
-        stocks = yf.download(tickers, start=start_date, end=end_date, progress=False)
-        stocks.to_csv("ai_companies_stocks.csv")
-        ai_stocks = pd.read_csv("ai_companies_stocks.csv", header=[0, 1], index_col=[0], parse_dates=[0])
+        close = load_close_prices(tickers, start_date, end_date)
         logger.info("Downloaded and loaded stock data.")
     except Exception as e:
         logger.error(f"Error downloading or loading stock data: {e}")
-        sys.exit(1)
-
-
-    close = ai_stocks.loc[:, "Close"].copy()
+        raise
 
 
     normalized_close = close.div(close.iloc[0]).mul(100)
@@ -74,59 +81,75 @@ with redirect_stdout(capture_buffer):
     portfolio_risk = np.sqrt(weights_array.T @ close_returns.cov().values @ weights_array) * np.sqrt(260)
 
 
-    fig_dir = "static"
     if not os.path.exists(fig_dir):
         os.makedirs(fig_dir)
 
     try:
-   
-        fig1, ax1 = plt.subplots(figsize=[15, 8])
-        close.plot(ax=ax1)
-        ax1.set_title("Stock Closing Prices Over Time")
-        stock_prices_path = f"{fig_dir}/stock_prices.png"
-        fig1.savefig(stock_prices_path)
-        plt.close(fig1)
-        logger.info("Saved stock prices plot.")
+        with span("plotting"):
+            fig1, ax1 = plt.subplots(figsize=[15, 8])
+            close.plot(ax=ax1)
+            ax1.set_title("Stock Closing Prices Over Time")
+            stock_prices_path = f"{url_prefix}/stock_prices.png"
+            fig1.savefig(os.path.join(fig_dir, "stock_prices.png"))
+            plt.close(fig1)
+            logger.info("Saved stock prices plot.")
 
         
-        fig2, ax2 = plt.subplots(figsize=(12, 8))
-        stocks_summary.plot.scatter(x="std", y="mean", s=50, fontsize=15, ax=ax2)
-        ax2.scatter(portfolio_risk, portfolio_return, color='red', marker='X', s=100, label='Portfolio')
-        for i in stocks_summary.index:
-            ax2.annotate(i, xy=(stocks_summary.loc[i, "std"] + 0.002, stocks_summary.loc[i, "mean"] + 0.002), size=15)
-        ax2.set_xlabel("Annual Risk (St. D)")
-        ax2.set_ylabel("Annual Return")
-        ax2.set_title("Stock Comparison with Risk Metrics (Risk/Return)")
-        ax2.legend()
-        scatter_plot_path = f"{fig_dir}/risk_return_scatter.png"
-        fig2.savefig(scatter_plot_path)
-        plt.close(fig2)
-        logger.info("Saved risk vs return scatter plot.")
+            fig2, ax2 = plt.subplots(figsize=(12, 8))
+            stocks_summary.plot.scatter(x="std", y="mean", s=50, fontsize=15, ax=ax2)
+            ax2.scatter(portfolio_risk, portfolio_return, color='red', marker='X', s=100, label='Portfolio')
+            for i in stocks_summary.index:
+                ax2.annotate(i, xy=(stocks_summary.loc[i, "std"] + 0.002, stocks_summary.loc[i, "mean"] + 0.002), size=15)
+            ax2.set_xlabel("Annual Risk (St. D)")
+            ax2.set_ylabel("Annual Return")
+            ax2.set_title("Stock Comparison with Risk Metrics (Risk/Return)")
+            ax2.legend()
+            scatter_plot_path = f"{url_prefix}/risk_return_scatter.png"
+            fig2.savefig(os.path.join(fig_dir, "risk_return_scatter.png"))
+            plt.close(fig2)
+            logger.info("Saved risk vs return scatter plot.")
 
        
-        fig3, ax3 = plt.subplots(figsize=(12, 8))
-        sns.heatmap(close_returns.corr(), cmap="Reds", annot=True, annot_kws={"size": 15}, vmin=-1, vmax=1, ax=ax3)
-        ax3.set_title("Stock Correlation Matrix")
-        heatmap_path = f"{fig_dir}/correlation_heatmap.png"
-        fig3.savefig(heatmap_path)
-        plt.close(fig3)
-        logger.info("Saved correlation heatmap.")
+            fig3, ax3 = plt.subplots(figsize=(12, 8))
+            sns.heatmap(close_returns.corr(), cmap="Reds", annot=True, annot_kws={"size": 15}, vmin=-1, vmax=1, ax=ax3)
+            ax3.set_title("Stock Correlation Matrix")
+            heatmap_path = f"{url_prefix}/correlation_heatmap.png"
+            fig3.savefig(os.path.join(fig_dir, "correlation_heatmap.png"))
+            plt.close(fig3)
+            logger.info("Saved correlation heatmap.")
     except Exception as e:
         logger.error(f"Error creating or saving plots: {e}")
-        sys.exit(1)
-    output = {
+        raise
+    return {
         "portfolio_return": f"{portfolio_return:.2%}",
         "portfolio_risk": f"{portfolio_risk:.2%}",
         "stock_prices_chart": stock_prices_path,
         "risk_return_scatter": scatter_plot_path,
         "correlation_heatmap": heatmap_path
     }
-    try:
-        output_json = json.dumps(output)
-        logger.info(f"Generated JSON output: {output_json}")
-    except (TypeError, ValueError) as e:
-        logger.error(f"Error generating JSON output: {e}")
-        output_json = json.dumps({"error": str(e)})
 
 
-sys.__stdout__.write(output_json)
\ No newline at end of file
+if __name__ == "__main__":
+    capture_buffer = io.StringIO()
+    with redirect_stdout(capture_buffer):
+        try:
+            investments = json.loads(sys.argv[1])
+            logger.info("Loaded investments from command-line argument.")
+        except Exception as e:
+            logger.error(f"Error loading investments: {e}")
+            sys.exit(1)
+        try:
+            with profiled("modified_spa"), span("request", script="modified_spa"):
+                output = analyze_portfolio(investments)
+        except Exception as e:
+            logger.exception("Risk analysis failed")
+            print("Error analyzing portfolio:", e, file=sys.stderr)
+            sys.exit(1)
+        try:
+            output_json = json.dumps(output)
+            logger.info(f"Generated JSON output: {output_json}")
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error generating JSON output: {e}")
+            output_json = json.dumps({"error": str(e)})
+
+    sys.__stdout__.write(output_json)
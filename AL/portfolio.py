@@ -5,7 +5,6 @@ import os
 import time
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import pickle
 import tensorflow as tf
 from tensorflow.keras.models import Sequential, load_model
@@ -20,6 +19,10 @@ import logging
 
 from prophet import Prophet
 
+from instrumentation import span, cache_result, profiled
+from market_data import get_provider
+from price_matrix import get_price_matrix
+
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=pd.errors.PerformanceWarning)
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -41,6 +44,9 @@ MIN_CANDIDATES = 2
 CACHE_DURATION = 86400
 LSTM_EPOCHS = 5
 LOOK_BACK = 50
+FORECAST_METHODS = ("autoregressive", "direct")
+DEFAULT_FORECAST_METHOD = "autoregressive"
+UNIVERSE_FILE = os.environ.get("PORTFOLIO_UNIVERSE_FILE")
 
 def get_historical_data_cached(ticker, period="1y", interval="1d", cache_duration=CACHE_DURATION):
     cache_filename = os.path.join(CACHE_DIR, f"{ticker}_{period}_{interval}.pkl")
@@ -48,19 +54,41 @@ def get_historical_data_cached(ticker, period="1y", interval="1d", cache_duratio
     if os.path.exists(cache_filename):
         if now - os.path.getmtime(cache_filename) < cache_duration:
             try:
-                return pd.read_pickle(cache_filename)
+                df = pd.read_pickle(cache_filename)
+                cache_result("prices", True)
+                return df
             except Exception as e:
                 logging.error(f"Error reading cache for {ticker}: {e}")
-    df = yf.download(ticker, period=period, interval=interval)
+    cache_result("prices", False)
+    provider = get_provider()
+    df = provider.history(ticker, period=period, interval=interval)
     df.dropna(inplace=True)
-    df.to_pickle(cache_filename)
+    # Replay reads these very pickles; writing its output back would overwrite the recorded data.
+    if provider.name != "replay":
+        df.to_pickle(cache_filename)
     return df
 
 get_historical_data = get_historical_data_cached
 
-def load_trained_model(ticker, cache_duration=CACHE_DURATION):
-    model_path = os.path.join(MODEL_DIR, f"{ticker}_lstm_model.keras")
-    scaler_path = os.path.join(MODEL_DIR, f"{ticker}_scaler.pkl")
+def get_close_values(ticker, closes=None):
+    # closes is a price-matrix column when the caller already holds the universe matrix.
+    if closes is not None:
+        return np.asarray(closes, dtype=np.float64).reshape(-1, 1)
+    df = get_historical_data(ticker, period="1y", interval="1d")
+    if df is None or df.empty:
+        return None
+    return df['Close'].values.reshape(-1, 1)
+
+def _model_paths(ticker, horizon=None):
+    # Direct models emit a fixed horizon, so each horizon gets its own files next to the one-step model.
+    prefix = f"{ticker}_lstm" if horizon is None else f"{ticker}_lstm_direct{horizon}"
+    scaler_prefix = ticker if horizon is None else f"{ticker}_direct{horizon}"
+    return (os.path.join(MODEL_DIR, f"{prefix}_model.keras"),
+            os.path.join(MODEL_DIR, f"{scaler_prefix}_scaler.pkl"),
+            os.path.join(MODEL_DIR, f"{prefix}_best.keras"))
+
+def load_trained_model(ticker, cache_duration=CACHE_DURATION, horizon=None):
+    model_path, scaler_path, _ = _model_paths(ticker, horizon)
     if os.path.exists(model_path) and os.path.exists(scaler_path):
         if time.time() - os.path.getmtime(model_path) < cache_duration:
             try:
@@ -68,43 +96,49 @@ def load_trained_model(ticker, cache_duration=CACHE_DURATION):
                 with open(scaler_path, "rb") as f:
                     scaler = pickle.load(f)
                 logging.info(f"✅ Loaded pre-trained model for {ticker}")
+                cache_result("lstm_model", True)
                 return model, scaler, LOOK_BACK
             except Exception as e:
                 logging.error(f"Error loading model for {ticker}: {e}")
+    cache_result("lstm_model", False)
     return None, None, None
 
-def save_trained_model(ticker, model, scaler):
-    model_path = os.path.join(MODEL_DIR, f"{ticker}_lstm_model.keras")
-    scaler_path = os.path.join(MODEL_DIR, f"{ticker}_scaler.pkl")
+def save_trained_model(ticker, model, scaler, horizon=None):
+    model_path, scaler_path, _ = _model_paths(ticker, horizon)
     model.save(model_path)
     with open(scaler_path, "wb") as f:
         pickle.dump(scaler, f)
     logging.info(f"✅ Saved model for {ticker}")
 
-def train_lstm_model(ticker, epochs=LSTM_EPOCHS, batch_size=32):
-    model, scaler, look_back = load_trained_model(ticker)
+def make_training_windows(scaled_data, look_back=LOOK_BACK, horizon=1):
+    X, y = [], []
+    for i in range(look_back, len(scaled_data) - horizon + 1):
+        X.append(scaled_data[i - look_back:i, 0])
+        y.append(scaled_data[i:i + horizon, 0])
+    X, y = np.array(X), np.array(y)
+    return X.reshape(X.shape[0], X.shape[1], 1), y
+
+def train_lstm_model(ticker, epochs=LSTM_EPOCHS, batch_size=32, horizon=None, closes=None):
+    # horizon=None trains the one-step model used for autoregressive rollout;
+    # an integer horizon trains a direct model whose output layer emits all horizon days at once.
+    model, scaler, look_back = load_trained_model(ticker, horizon=horizon)
     if model is not None:
         return model, scaler, look_back
 
     logging.info(f"🔄 Training new LSTM model for {ticker}...")
-    df = get_historical_data(ticker, period="1y", interval="1d")
-    if df is None or df.empty:
+    data = get_close_values(ticker, closes)
+    if data is None or len(data) == 0:
         logging.error(f"❌ No data available for {ticker}.")
         return None, None, None
 
-    data = df['Close'].values.reshape(-1, 1)
     scaler = MinMaxScaler()
     scaled_data = scaler.fit_transform(data)
-    if len(scaled_data) <= LOOK_BACK:
-        logging.error(f"Not enough data to train {ticker} (need > {LOOK_BACK} points).")
+    outputs = horizon or 1
+    if len(scaled_data) <= LOOK_BACK + outputs - 1:
+        logging.error(f"Not enough data to train {ticker} (need > {LOOK_BACK + outputs - 1} points).")
         return None, None, None
 
-    X, y = [], []
-    for i in range(LOOK_BACK, len(scaled_data)):
-        X.append(scaled_data[i - LOOK_BACK:i, 0])
-        y.append(scaled_data[i, 0])
-    X, y = np.array(X), np.array(y)
-    X = X.reshape(X.shape[0], X.shape[1], 1)
+    X, y = make_training_windows(scaled_data, LOOK_BACK, outputs)
 
     model = Sequential([
         tf.keras.Input(shape=(X.shape[1], 1)),
@@ -112,51 +146,73 @@ def train_lstm_model(ticker, epochs=LSTM_EPOCHS, batch_size=32):
         Dropout(0.2),
         LSTM(50),
         Dropout(0.2),
-        Dense(1)
+        Dense(outputs)
     ])
     model.compile(optimizer='adam', loss='mean_squared_error')
     callbacks = [
         EarlyStopping(monitor='loss', patience=2, restore_best_weights=True),
-        ModelCheckpoint(os.path.join(MODEL_DIR, f"{ticker}_lstm_best.keras"), monitor='loss', save_best_only=True)
+        ModelCheckpoint(_model_paths(ticker, horizon)[2], monitor='loss', save_best_only=True)
     ]
-    model.fit(X, y, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=callbacks)
-    save_trained_model(ticker, model, scaler)
+    with span("training", model="lstm" if horizon is None else "lstm_direct"):
+        model.fit(X, y, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=callbacks)
+    save_trained_model(ticker, model, scaler, horizon)
     return model, scaler, LOOK_BACK
 
-def forecast_lstm_weekly(ticker, model, scaler, look_back=LOOK_BACK, forecast_weeks=5, days_per_week=5):
-    df = get_historical_data(ticker, period="1y", interval="1d")
-    if df is None or df.empty:
+def forecast_lstm_weekly(ticker, model, scaler, look_back=LOOK_BACK, forecast_weeks=5, days_per_week=5, closes=None):
+    data = get_close_values(ticker, closes)
+    if data is None or len(data) == 0:
         return None
-    data = df['Close'].values.reshape(-1, 1)
     scaled_data = scaler.transform(data)
     last_seq = scaled_data[-look_back:]
     weekly_forecasts = []
-    for _ in range(forecast_weeks):
-        for _ in range(days_per_week):
-            X_input = last_seq.reshape(1, look_back, 1)
-            pred = model.predict(X_input, verbose=0)[0][0]
-            last_seq = np.append(last_seq[1:], [[pred]], axis=0)
-        weekly_forecasts.append(pred)
+    with span("inference", model="lstm"):
+        for _ in range(forecast_weeks):
+            for _ in range(days_per_week):
+                X_input = last_seq.reshape(1, look_back, 1)
+                pred = model.predict(X_input, verbose=0)[0][0]
+                last_seq = np.append(last_seq[1:], [[pred]], axis=0)
+            weekly_forecasts.append(pred)
     forecasted_prices = scaler.inverse_transform(np.array(weekly_forecasts).reshape(-1, 1)).flatten()
     return forecasted_prices
 
-def compute_lstm_return(ticker, forecast_weeks=1, days_per_week=5):
-    result = train_lstm_model(ticker, epochs=5, batch_size=32)
-    if result is None:
-        logging.error(f"❌ Model training failed for {ticker}")
+def forecast_lstm_direct(ticker, model, scaler, look_back=LOOK_BACK, forecast_weeks=5, days_per_week=5, closes=None):
+    # Single forward pass over the last window; returns the same week-end prices as forecast_lstm_weekly.
+    data = get_close_values(ticker, closes)
+    if data is None or len(data) == 0:
         return None
-    model, scaler, look_back = result
+    scaled_data = scaler.transform(data)
+    X_input = scaled_data[-look_back:].reshape(1, look_back, 1)
+    with span("inference", model="lstm_direct"):
+        path = model.predict(X_input, verbose=0)[0]
+    weekly_forecasts = path[days_per_week - 1::days_per_week][:forecast_weeks]
+    return scaler.inverse_transform(np.array(weekly_forecasts).reshape(-1, 1)).flatten()
+
+def forecast_lstm(ticker, forecast_weeks=5, days_per_week=5, epochs=LSTM_EPOCHS, method=DEFAULT_FORECAST_METHOD,
+                  closes=None):
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method: {method}")
+    horizon = forecast_weeks * days_per_week if method == "direct" else None
+    model, scaler, look_back = train_lstm_model(ticker, epochs=epochs, batch_size=32, horizon=horizon, closes=closes)
+    if model is None:
+        return None
+    if method == "direct":
+        return forecast_lstm_direct(ticker, model, scaler, look_back, forecast_weeks, days_per_week, closes)
+    return forecast_lstm_weekly(ticker, model, scaler, look_back, forecast_weeks, days_per_week, closes)
 
-    pred_prices = forecast_lstm_weekly(ticker, model, scaler, look_back, forecast_weeks, days_per_week)
+def compute_lstm_return(ticker, forecast_weeks=1, days_per_week=5, method=DEFAULT_FORECAST_METHOD, closes=None):
+    pred_prices = forecast_lstm(ticker, forecast_weeks, days_per_week, epochs=5, method=method, closes=closes)
     if pred_prices is None or len(pred_prices) == 0:
         logging.error(f"❌ Forecasting failed for {ticker}")
         return None
     final_pred_price = float(pred_prices[-1])
-    df_today = get_historical_data(ticker, period="1d", interval="1d")
-    if df_today is None or df_today.empty:
-        logging.error(f"❌ No current day data for {ticker}")
-        return None
-    current_price = float(df_today['Close'].iloc[0])
+    if closes is not None and len(closes):
+        current_price = float(closes[-1])
+    else:
+        df_today = get_historical_data(ticker, period="1d", interval="1d")
+        if df_today is None or df_today.empty:
+            logging.error(f"❌ No current day data for {ticker}")
+            return None
+        current_price = float(df_today['Close'].iloc[0])
     if current_price <= 0:
         logging.error(f"❌ Invalid current price for {ticker}: {current_price}")
         return None
@@ -177,15 +233,18 @@ def forecast_prophet(ticker, forecast_days=10):
     if df_prophet.empty:
         return None
     model = Prophet(daily_seasonality=True, yearly_seasonality=True)
-    model.fit(df_prophet)
-    future = model.make_future_dataframe(periods=forecast_days)
-    forecast = model.predict(future)
+    with span("training", model="prophet"):
+        model.fit(df_prophet)
+    with span("inference", model="prophet"):
+        future = model.make_future_dataframe(periods=forecast_days)
+        forecast = model.predict(future)
     return float(forecast['yhat'].iloc[-1])
 
-def ensemble_forecast(ticker, forecast_days_prophet=10, forecast_days_lstm=5):
+def ensemble_forecast(ticker, forecast_days_prophet=10, forecast_days_lstm=5, method=DEFAULT_FORECAST_METHOD):
     prophet_price = forecast_prophet(ticker, forecast_days=forecast_days_prophet)
-    lstm_model, scaler, look_back = train_lstm_model(ticker, epochs=20, batch_size=32)
-    lstm_prices = forecast_lstm_weekly(ticker, lstm_model, scaler, look_back, forecast_weeks=forecast_days_lstm, days_per_week=5)
+    lstm_prices = forecast_lstm(ticker, forecast_weeks=forecast_days_lstm, days_per_week=5, epochs=20, method=method)
+    if lstm_prices is None or len(lstm_prices) == 0:
+        return None
     lstm_price = float(lstm_prices[-1])
     
     df_today = get_historical_data(ticker, period="1d", interval="1d")
@@ -213,6 +272,10 @@ def compute_historical_return(ticker, period="5y"):
     return annual_return
 
 def get_extended_universe():
+    # PORTFOLIO_UNIVERSE_FILE (one ticker per line, e.g. the Nifty 500) replaces the built-in list.
+    if UNIVERSE_FILE:
+        with open(UNIVERSE_FILE, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
     universe = [
     "HDFCBANK.NS", "ICICIBANK.NS", "SBIN.NS", "KOTAKBANK.NS", "AXISBANK.NS", "BAJFINANCE.NS", "BAJAJFINSV.NS", 
     "HDFC.NS", "SBILIFE.NS", "HDFCLIFE.NS", "ICICIPRULI.NS",
@@ -259,12 +322,27 @@ def cap_weights(weights, cap):
             capped[ticker] /= total
     return capped
 
-def recommend_portfolio(risk_level, income, goal_duration, monthly_investment, target_amount, sector_cap=0.30):
+def recommend_portfolio(risk_level, income, goal_duration, monthly_investment, target_amount, sector_cap=0.30,
+                        forecast_method=DEFAULT_FORECAST_METHOD):
     universe = get_extended_universe()
+    # One shared date x ticker matrix instead of a pickle per ticker; missing tickers are fetched in bulk.
+    # Falls back to the per-ticker pickles when the matrix cannot be opened or built.
+    try:
+        prices = get_price_matrix(universe, period="1y")
+    except Exception as e:
+        logging.error(f"Price matrix unavailable: {e}")
+        prices = None
     computed_returns = {}
     for ticker in universe:
+        closes = None
+        if prices is not None:
+            if ticker not in prices:
+                logging.error(f"❌ No price history for {ticker}")
+                continue
+            closes = prices.column(ticker)
         try:
-            short_ret = compute_lstm_return(ticker, forecast_weeks=1, days_per_week=5)
+            short_ret = compute_lstm_return(ticker, forecast_weeks=1, days_per_week=5, method=forecast_method,
+                                            closes=closes)
             if short_ret is None:
                 continue
             if short_ret > 0:
@@ -288,7 +366,7 @@ def recommend_portfolio(risk_level, income, goal_duration, monthly_investment, t
     ticker_details = {}
     for ticker in filtered_scores.keys():
         try:
-            info = yf.Ticker(ticker).info
+            info = get_provider().info(ticker)
             market_cap = info.get('marketCap', 1)
             sector = info.get('sector', 'Unknown')
             ticker_details[ticker] = {'market_cap': market_cap, 'sector': sector}
@@ -340,16 +418,20 @@ if __name__ == '__main__':
     parser.add_argument('--goal_duration', type=int, required=True, help="Goal duration in years")
     parser.add_argument('--monthly_investment', type=float, required=True, help="Current monthly investment in dollars")
     parser.add_argument('--target_amount', type=float, required=True, help="Target goal amount in dollars")
+    parser.add_argument('--forecast_method', type=str, choices=FORECAST_METHODS, default=DEFAULT_FORECAST_METHOD,
+                        help="LSTM forecast: one-step autoregressive rollout or direct multi-horizon output")
     
     args = parser.parse_args()
     
-    recommendations, required_PMT = recommend_portfolio(
-        args.risk_level,
-        args.income,
-        args.goal_duration,
-        args.monthly_investment,
-        args.target_amount
-    )
+    with profiled("portfolio"), span("request", script="portfolio"):
+        recommendations, required_PMT = recommend_portfolio(
+            args.risk_level,
+            args.income,
+            args.goal_duration,
+            args.monthly_investment,
+            args.target_amount,
+            forecast_method=args.forecast_method
+        )
     
     result = {
         "recommendations": recommendations,
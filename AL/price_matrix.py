@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from instrumentation import span, cache_result
+from market_data import get_provider
+
+# A date x ticker float32 matrix of one price field, stored column-major so each ticker's history is a
+# contiguous slice. The .f32 file is memory-mapped read-only: every process that opens it (or inherits it
+# over fork) shares the same page-cache pages instead of holding its own copy. The JSON index holds the
+# calendar and ticker order and names the data file, so a rebuild swaps both in with one os.replace. Rebuilds
+# hold an flock on <index>.lock, so concurrent processes take turns and the later one reuses the earlier result.
+PRICE_MATRIX_DIR = os.environ.get("PRICE_MATRIX_DIR", "cache")
+PRICE_MATRIX_MAX_AGE = 86400
+
+_open_matrices = {}
+_lock = threading.Lock()
+
+class PriceMatrix:
+    def __init__(self, index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.index_path = index_path
+        self.built = meta["built"]
+        self.field = meta["field"]
+        self.dates = pd.DatetimeIndex(meta["dates"])
+        self.tickers = list(meta["tickers"])
+        self.missing = set(meta.get("missing", []))
+        self.positions = {ticker: i for i, ticker in enumerate(self.tickers)}
+        shape = (len(self.dates), len(self.tickers))
+        if shape[0] and shape[1] and meta.get("data"):
+            data_path = os.path.join(os.path.dirname(index_path), meta["data"])
+            self.values = np.memmap(data_path, dtype=np.float32, mode="r", shape=shape, order="F")
+        else:
+            self.values = np.empty(shape, dtype=np.float32)
+
+    def __contains__(self, ticker):
+        return ticker in self.positions
+
+    def rows(self, start=None, end=None):
+        first = self.dates.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        last = self.dates.searchsorted(pd.Timestamp(end)) if end is not None else len(self.dates)
+        return slice(first, last)
+
+    def column(self, ticker, start=None, end=None):
+        # Zero-copy view unless the ticker has gaps on the shared calendar.
+        values = self.values[self.rows(start, end), self.positions[ticker]]
+        present = ~np.isnan(values)
+        return values if present.all() else values[present]
+
+    def series(self, ticker, start=None, end=None):
+        rows = self.rows(start, end)
+        return pd.Series(self.values[rows, self.positions[ticker]], index=self.dates[rows], name=ticker).dropna()
+
+    def frame(self, tickers=None, start=None, end=None):
+        tickers = self.tickers if tickers is None else list(tickers)
+        rows = self.rows(start, end)
+        columns = [self.positions[ticker] for ticker in tickers]
+        return pd.DataFrame(self.values[rows][:, columns], index=self.dates[rows], columns=tickers)
+
+    def returns(self, tickers=None, start=None, end=None):
+        # Simple daily returns over the dates on which every requested ticker has a price.
+        prices = self.frame(tickers, start, end).dropna().to_numpy(dtype=np.float64)
+        return prices[1:] / prices[:-1] - 1.0
+
+def matrix_index_path(period="1y", interval="1d", field="Close", directory=PRICE_MATRIX_DIR):
+    return os.path.join(directory, f"prices_{field.lower()}_{period}_{interval}.json")
+
+def open_price_matrix(index_path):
+    # Reopens only when the index file was replaced, so threads in one process share a single mapping.
+    try:
+        stamp = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _open_matrices.get(index_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        matrix = PriceMatrix(index_path)
+    except Exception as e:
+        print("Ignoring unreadable price matrix:", e, file=sys.stderr)
+        return None
+    _open_matrices[index_path] = (stamp, matrix)
+    return matrix
+
+def build_price_matrix(tickers, period="1y", interval="1d", field="Close", directory=PRICE_MATRIX_DIR,
+                       reuse=None, provider=None):
+    # Tickers already in `reuse` keep their columns; only the rest are fetched, in bulk.
+    os.makedirs(directory, exist_ok=True)
+    index_path = matrix_index_path(period, interval, field, directory)
+    tickers = list(dict.fromkeys(tickers))
+    reused = [ticker for ticker in tickers if reuse is not None and ticker in reuse]
+    fetch = [ticker for ticker in tickers if ticker not in reused]
+    columns = {ticker: reuse.series(ticker) for ticker in reused}
+    missing = sorted(reuse.missing - set(tickers)) if reuse is not None else []
+    if fetch:
+        frames = (provider or get_provider()).bulk_history(fetch, period=period, interval=interval)
+        for ticker in fetch:
+            df = frames.get(ticker)
+            if df is None or df.empty or field not in df.columns or df[field].dropna().empty:
+                missing.append(ticker)
+            else:
+                columns[ticker] = df[field].dropna()
+    names = [ticker for ticker in tickers if ticker in columns]
+    calendar = pd.DatetimeIndex([])
+    for ticker in names:
+        calendar = calendar.union(columns[ticker].index)
+
+    base = os.path.basename(index_path)[:-len(".json")]
+    previous_data = _indexed_data_name(index_path)
+    with span("price_matrix_build"):
+        data_name = None
+        if len(calendar) and names:
+            fd, data_path = tempfile.mkstemp(prefix=base + ".", suffix=".f32", dir=directory)
+            os.close(fd)
+            data_name = os.path.basename(data_path)
+            values = np.memmap(data_path, dtype=np.float32, mode="w+", shape=(len(calendar), len(names)), order="F")
+            values[:] = np.nan
+            for i, ticker in enumerate(names):
+                values[calendar.get_indexer(columns[ticker].index), i] = columns[ticker].to_numpy(dtype=np.float32)
+            values.flush()
+            del values
+        meta = {"built": time.time(), "field": field, "period": period, "interval": interval, "data": data_name,
+                "dates": [d.strftime("%Y-%m-%d") for d in calendar], "tickers": names, "missing": missing}
+        fd, tmp_path = tempfile.mkstemp(prefix=base + ".", suffix=".json.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, index_path)
+        except Exception:
+            for path in (tmp_path, data_name and os.path.join(directory, data_name)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            raise
+    # Only the file the replaced index named goes; processes still mapping it keep their pages until they close.
+    if previous_data and previous_data != data_name:
+        try:
+            os.remove(os.path.join(directory, previous_data))
+        except OSError:
+            pass
+    return open_price_matrix(index_path)
+
+def _indexed_data_name(index_path):
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("data")
+    except Exception:
+        return None
+
+@contextmanager
+def _rebuild_lock(index_path):
+    if fcntl is None:
+        yield
+        return
+    with open(index_path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def get_price_matrix(tickers, period="1y", interval="1d", field="Close", max_age=PRICE_MATRIX_MAX_AGE,
+                     directory=PRICE_MATRIX_DIR):
+    # A fresh matrix is extended with any tickers it has not seen; a stale one is rebuilt from scratch.
+    # Returns None when no matrix could be opened or built; callers fall back to per-ticker data.
+    index_path = matrix_index_path(period, interval, field, directory)
+
+    def usable(matrix):
+        fresh = matrix is not None and time.time() - matrix.built < max_age
+        wanted = [ticker for ticker in tickers if not (fresh and (ticker in matrix or ticker in matrix.missing))]
+        return fresh, wanted
+
+    with _lock:
+        matrix = open_price_matrix(index_path)
+        fresh, wanted = usable(matrix)
+        cache_result("price_matrix", not wanted)
+        if not wanted:
+            return matrix
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with _rebuild_lock(index_path):
+                # Another process may have rebuilt while this one waited for the lock.
+                matrix = open_price_matrix(index_path)
+                fresh, wanted = usable(matrix)
+                if not wanted:
+                    return matrix
+                if fresh:
+                    return build_price_matrix(matrix.tickers + wanted, period, interval, field, directory,
+                                              reuse=matrix)
+                return build_price_matrix(tickers, period, interval, field, directory)
+        except Exception as e:
+            print("Error building price matrix:", e, file=sys.stderr)
+            return None
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import re
+import sys
+import threading
+import multiprocessing
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+SENTIMENT_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+SENTIMENT_BATCH_SIZE = 16
+MIN_PARALLEL_ARTICLES = 32
+
+# A sentence ends at terminal punctuation (plus closing quotes) followed by whitespace and an uppercase
+# letter or opening quote, or at a line break. "3.5%", "Rs 1,234.50" and "Dr. Reddy's" stay in one sentence.
+SENTENCE_END_PATTERN = re.compile(r"[.!?]+[\"'\u201d\u2019)\]]*(?=\s+[\"'\u201c\u2018(]?[A-Z])")
+LINE_PATTERN = re.compile(r"[^\n]+")
+PRECEDING_WORD_PATTERN = re.compile(r"([A-Za-z]+(?:\.[A-Za-z]+)*)$")
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "prof", "sr", "jr", "st", "ltd", "pvt", "inc", "co", "corp", "bros",
+                 "rs", "no", "nos", "vs", "etc", "approx", "govt", "dept", "est", "mn", "bn", "cr", "jan", "feb",
+                 "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "e.g", "i.e", "u.s"}
+
+_analyzer = None
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_analyzer():
+    # VADER reads its lexicon from disk on construction, so keep one per process.
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+def score_text(text):
+    if not text:
+        return 0.0
+    return get_analyzer().polarity_scores(text)["compound"]
+
+def _is_abbreviation(text, line_start, end):
+    if text[end] != ".":
+        return False
+    word = PRECEDING_WORD_PATTERN.search(text, line_start, end)
+    if word is None:
+        return False
+    # Single capitals are initials ("N. Chandrasekaran").
+    return word.group(1).lower() in ABBREVIATIONS or (len(word.group(1)) == 1 and word.group(1).isupper())
+
+def split_sentences(text):
+    spans = []
+    for line in LINE_PATTERN.finditer(text):
+        start = line.start()
+        for end in SENTENCE_END_PATTERN.finditer(text, line.start(), line.end()):
+            if _is_abbreviation(text, line.start(), end.start()):
+                continue
+            if text[start:end.end()].strip():
+                spans.append((start, end.end()))
+            start = end.end()
+        if text[start:line.end()].strip():
+            spans.append((start, line.end()))
+    return spans
+
+def score_article(text, mentions=None):
+    # mentions are (start, end, ticker) spans; each ticker gets the mean score of the sentences naming it.
+    result = {"compound": score_text(text), "tickers": {}}
+    if not text or not mentions:
+        return result
+    sentences = split_sentences(text)
+    if not sentences:
+        return result
+    starts = [start for start, _ in sentences]
+    sentence_scores = {}
+    per_ticker = {}
+    for start, _, ticker in mentions:
+        idx = max(0, bisect_right(starts, start) - 1)
+        if idx not in sentence_scores:
+            s_start, s_end = sentences[idx]
+            sentence_scores[idx] = score_text(text[s_start:s_end])
+        per_ticker.setdefault(ticker, {})[idx] = sentence_scores[idx]
+    result["tickers"] = {ticker: sum(scores.values()) / len(scores) for ticker, scores in per_ticker.items()}
+    return result
+
+# Modules a scoring worker should never have loaded; the caller's script is re-imported in each worker as
+# __mp_main__, so a top-level import of one of these costs every worker its full setup and memory.
+WORKER_FORBIDDEN_MODULES = ("tensorflow",)
+
+def _init_worker():
+    loaded = [name for name in WORKER_FORBIDDEN_MODULES if name in sys.modules]
+    if loaded:
+        print(f"sentiment worker {os.getpid()} loaded {', '.join(loaded)} via __mp_main__; "
+              "import it lazily in the calling script", file=sys.stderr)
+    get_analyzer()
+
+def _score_batch(batch):
+    return [score_article(text, mentions) for text, mentions in batch]
+
+def get_pool(workers=SENTIMENT_WORKERS):
+    # One long-lived pool per process. Workers come from a forkserver that has only imported this module, so
+    # they never inherit the caller's threads, TensorFlow state or locks (the analytics service is all three).
+    # Each worker still re-imports the caller's main script, which is why callers keep heavy imports lazy.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+                ctx.set_forkserver_preload(["sentiment"])
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker)
+        return _pool
+
+def score_articles(items, workers=SENTIMENT_WORKERS, batch_size=SENTIMENT_BATCH_SIZE):
+    # items is a list of (text, mentions); results come back in the same order.
+    global _pool
+    items = list(items)
+    if workers <= 1 or len(items) < MIN_PARALLEL_ARTICLES:
+        return _score_batch(items)
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    pool = get_pool(workers)
+    results = []
+    try:
+        for batch_result in pool.map(_score_batch, batches):
+            results.extend(batch_result)
+    except BrokenProcessPool:
+        # A worker died; drop the pool so the next call starts a fresh one, and finish inline.
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return _score_batch(items)
+    return results
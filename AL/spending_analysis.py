@@ -5,23 +5,55 @@ import os
 import sys
 import time
 import json
+import csv
+import argparse
+import re
+import calendar
 import warnings
+from itertools import islice
 from datetime import datetime
 
+import numpy as np
+
+from instrumentation import span, profiled
+
 warnings.filterwarnings("ignore")
 
+NEEDS_CATEGORIES = {"health", "education", "rent", "groceries"}
+WANTS_CATEGORIES = {"shopping", "misc"}
+BUCKETS = ("Needs", "Wants", "Savings")
+BATCH_CHUNK_SIZE = 10000
+STATEMENT_CHUNK_SIZE = 50000
+DEFAULT_CATEGORY_MAPPING = {
+    "Needs": {
+        "categories": sorted(NEEDS_CATEGORIES) + ["utilities", "insurance", "transport", "medical", "emi"],
+        "keywords": ["rent", "electricity", "water bill", "gas bill", "pharmacy", "hospital", "school",
+                     "tuition", "grocery", "supermarket", "insurance", "fuel", "metro", "loan emi"]
+    },
+    "Wants": {
+        "categories": sorted(WANTS_CATEGORIES) + ["dining", "entertainment", "travel", "subscriptions"],
+        "keywords": ["restaurant", "swiggy", "zomato", "netflix", "spotify", "amazon", "flipkart",
+                     "myntra", "movie", "cafe", "bar", "hotel", "flight"]
+    },
+    "columns": {"date": "date", "amount": "amount", "category": "category", "description": "description",
+                "type": "type"},
+    "credit_types": ["credit", "cr"],
+    # For rows without a type: "positive" or "negative" names the sign credits carry, "none" treats every row
+    # as spending, and "auto" reads positives as credits if the first chunk contains any negative amount.
+    "credit_sign": "auto"
+}
+MAX_SCENARIO_MONTHS = 600
+
 def classify_expenses(expenses):
     categorized_expenses = {"Needs": [], "Wants": [], "Savings": []}
-    needs_categories = {"health", "education", "rent", "groceries"}
-    wants_categories = {"shopping", "misc"}
     for item, amount, category in expenses:
         try:
             amount = float(amount)
         except Exception:
             amount = 0.0
-        if category.lower() in needs_categories:
+        if category.lower() in NEEDS_CATEGORIES:
             categorized_expenses["Needs"].append((item, amount))
-        elif category.lower() in wants_categories:
+        elif category.lower() in WANTS_CATEGORIES:
             categorized_expenses["Wants"].append((item, amount))
         else:
             categorized_expenses["Savings"].append((item, amount))
@@ -38,10 +70,10 @@ def optimize_spending(income, expenses, target_amount, interest_rate, start_date
     categorized_expenses = classify_expenses(expenses)
     total_needs = round(sum(amount for _, amount in categorized_expenses["Needs"]), 2)
     total_wants = round(sum(amount for _, amount in categorized_expenses["Wants"]), 2)
-    total_savings = round(sum(amount for _, amount in categorized_expenses["Savings"]), 2)
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    months = max(1, (end.year - start.year) * 12 + (end.month - start.month))
+    return optimize_spending_totals(income, total_needs, total_wants, target_amount, interest_rate, start_date, end_date)
+
+def optimize_spending_totals(income, total_needs, total_wants, target_amount, interest_rate, start_date, end_date):
+    months = months_between(start_date, end_date)
     monthly_savings_needed = round(calculate_amortized_payment(target_amount, interest_rate, months), 2)
     if monthly_savings_needed > income:
         return {
@@ -81,7 +113,401 @@ def optimize_spending(income, expenses, target_amount, interest_rate, start_date
     recommendations["Next Month Savings Target"] = new_monthly_savings_needed
     return recommendations
 
+def months_between(start_date, end_date):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    return max(1, (end.year - start.year) * 12 + (end.month - start.month))
+
+def calculate_amortized_payments(target_amounts, interest_rates, months):
+    # Column form of calculate_amortized_payment; the 5% floor means the rate is never zero.
+    r = np.maximum(interest_rates, 5) / 100 / 12
+    return (target_amounts * r) / (1 - (1 + r) ** -months)
+
+def _round2(values):
+    # + 0.0 turns -0.0 (e.g. np.maximum(0, -0.0)) into 0.0 so JSON output never shows "-0.0".
+    return np.round(values, 2) + 0.0
+
+def _bucket_of(category):
+    category = str(category).lower()
+    if category in NEEDS_CATEGORIES:
+        return 0
+    if category in WANTS_CATEGORIES:
+        return 1
+    return 2
+
+def bucket_totals(expense_lists):
+    # Flattens every record's expenses into one amount column and sums them per (record, bucket).
+    owners, buckets, amounts = [], [], []
+    bucket_codes = {}
+    for idx, expenses in enumerate(expense_lists):
+        for _, amount, category in expenses:
+            try:
+                amount = float(amount)
+            except Exception:
+                amount = 0.0
+            code = bucket_codes.get(category)
+            if code is None:
+                code = bucket_codes[category] = _bucket_of(category)
+            owners.append(idx)
+            buckets.append(code)
+            amounts.append(amount)
+    n = len(expense_lists)
+    keys = np.asarray(owners, dtype=np.int64) * 3 + np.asarray(buckets, dtype=np.int64)
+    totals = np.bincount(keys, weights=np.asarray(amounts, dtype=float), minlength=n * 3)
+    return _round2(totals.reshape(n, 3))
+
+def optimize_spending_columns(income, total_needs, total_wants, target_amount, interest_rate, months):
+    # Vectorized optimize_spending over equal-length columns; returns one result dict per row.
+    needed = _round2(calculate_amortized_payments(target_amount, interest_rate, months))
+    unreachable = needed > income
+    discretionary = income - total_needs
+    savings = _round2(np.minimum(discretionary, needed))
+    wants = _round2(discretionary - savings)
+    short = savings < needed
+    cut_wants = np.where(short, _round2(np.minimum(total_wants, _round2(needed - savings))), 0.0)
+    wants = wants - cut_wants
+    savings = savings + cut_wants
+    still_short = short & (savings < needed)
+    new_months = np.maximum(1, months - 1)
+    new_needed = _round2(calculate_amortized_payments(target_amount - savings, interest_rate, new_months))
+    total_next = total_needs + wants + new_needed
+    safe_total = np.where(total_next > 0, total_next, 1)
+    scale = np.where(total_next > 0, income / safe_total, 1)
+    min_needs = _round2(np.maximum(total_needs * scale, 1000))
+    wants_limit = _round2(np.maximum(0, wants * scale))
+    savings_limit = _round2(np.maximum(0, new_needed * scale))
+    results = []
+    for i in range(len(income)):
+        if unreachable[i]:
+            results.append({
+                "error": f"Sorry, the target is not reachable within the given timeframe. Consider increasing income by at least {needed[i] - income[i]:.2f} through other sources."
+            })
+            continue
+        adjustments = {}
+        if short[i]:
+            adjustments["Reduce Wants"] = float(cut_wants[i])
+            if still_short[i]:
+                adjustments["Increase Income"] = f"Increase income by at least {needed[i] - savings[i]:.2f}"
+                adjustments["Reduce Needs"] = "Evaluate and reduce fixed expenses if possible. Consider cutting costs in groceries."
+        else:
+            adjustments["Success"] = "You are on the right track!"
+        if min_needs[i] > income[i]:
+            adjustments["Cut Fixed Costs"] = "Consider reducing costs in groceries and other essential expenses."
+        results.append({
+            "Monthly Savings Target": float(needed[i]),
+            "Suggested Adjustments": adjustments,
+            "Next Month Limits": {
+                "Needs": float(min_needs[i]),
+                "Wants": float(wants_limit[i]),
+                "Savings": float(savings_limit[i])
+            },
+            "Next Month Savings Target": float(new_needed[i])
+        })
+    return results
+
+def parse_expenses(expenses):
+    # Same shape classify_expenses unpacks: a list of (item, amount, category) with a string category.
+    if not isinstance(expenses, (list, tuple)):
+        raise ValueError("expenses must be a list of [item, amount, category] entries")
+    for entry in expenses:
+        if not isinstance(entry, (list, tuple)) or len(entry) != 3 or not isinstance(entry[2], str):
+            raise ValueError(f"expense entry {entry!r} is not [item, amount, category]")
+    return [tuple(entry) for entry in expenses]
+
+def parse_record(input_data):
+    return {
+        "income": float(input_data["income"]),
+        "target_amount": float(input_data["target_amount"]),
+        "interest_rate": float(input_data["interest_rate"]),
+        "months": months_between(input_data["start_date"], input_data["end_date"]),
+        "expenses": parse_expenses(input_data["expenses"])
+    }
+
+def _optimize_parsed(parsed):
+    totals = bucket_totals([p["expenses"] for p in parsed])
+    column = lambda key, dtype=float: np.array([p[key] for p in parsed], dtype=dtype)
+    return optimize_spending_columns(column("income"), totals[:, 0], totals[:, 1],
+                                     column("target_amount"), column("interest_rate"),
+                                     column("months", np.int64))
+
+def optimize_spending_batch(records):
+    # records are raw input dicts as accepted by main(); bad rows get an error entry instead of failing the batch.
+    results = [None] * len(records)
+    valid, parsed = [], []
+    for idx, record in enumerate(records):
+        try:
+            parsed.append(parse_record(record))
+            valid.append(idx)
+        except Exception as e:
+            results[idx] = {"error": f"Invalid input format: {str(e)}"}
+    if parsed:
+        try:
+            computed = _optimize_parsed(parsed)
+        except Exception:
+            # Something slipped past parse_record; score row by row so only the offending record fails.
+            computed = []
+            for p in parsed:
+                try:
+                    computed.append(_optimize_parsed([p])[0])
+                except Exception as e:
+                    computed.append({"error": f"Invalid input format: {str(e)}"})
+        for idx, result in zip(valid, computed):
+            results[idx] = result
+    for record, result in zip(records, results):
+        if isinstance(record, dict) and "id" in record:
+            result["id"] = record["id"]
+    return results
+
+def run_batch(infile, outfile, chunk_size=BATCH_CHUNK_SIZE):
+    # Reads JSON-lines records and writes one JSON-lines result per input line, chunk by chunk.
+    while True:
+        lines = list(islice(infile, chunk_size))
+        if not lines:
+            break
+        records, results = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+                results.append(None)
+            except Exception as e:
+                records.append(None)
+                results.append({"error": f"Invalid JSON input: {str(e)}"})
+        positions = [i for i, result in enumerate(results) if result is None]
+        with span("optimize", mode="batch"):
+            batch_results = optimize_spending_batch([records[i] for i in positions])
+        for i, result in zip(positions, batch_results):
+            results[i] = result
+        for result in results:
+            outfile.write(json.dumps(result) + "\n")
+        outfile.flush()
+
+def add_months(start_date, months):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    month_index = start.month - 1 + int(months)
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return datetime(year, month, day).strftime("%Y-%m-%d")
+
+def scenario_values(spec):
+    # A scenario axis is a list of values, a single number, or {"start", "stop", "step"} (stop inclusive).
+    if isinstance(spec, dict):
+        start, stop, step = float(spec["start"]), float(spec["stop"]), float(spec.get("step", 1))
+        if step <= 0:
+            raise ValueError("step must be positive")
+        return np.arange(start, stop + step / 2, step)
+    if isinstance(spec, (list, tuple)):
+        return np.array([float(v) for v in spec])
+    return np.array([float(spec)])
+
+def feasibility_grid(income, expenses, target_amounts, interest_rates, horizons_months, start_date=None,
+                     max_months=MAX_SCENARIO_MONTHS):
+    # Evaluates every (target, rate, horizon) combination in one broadcast; axis order is [target][rate][horizon].
+    categorized_expenses = classify_expenses(expenses)
+    total_needs = round(sum(amount for _, amount in categorized_expenses["Needs"]), 2)
+    targets = np.asarray(target_amounts, dtype=float)
+    rates = np.asarray(interest_rates, dtype=float)
+    horizons = np.maximum(1, np.asarray(horizons_months, dtype=np.int64))
+    required = _round2(calculate_amortized_payments(targets[:, None, None], rates[None, :, None],
+                                                    horizons[None, None, :]))
+    feasible = required <= income
+    within_discretionary = required <= income - total_needs
+    # Payments fall monotonically with the horizon, so the first feasible month on a 1..max_months axis is the earliest.
+    all_months = np.arange(1, max_months + 1)
+    payments = _round2(calculate_amortized_payments(targets[:, None, None], rates[None, :, None],
+                                                    all_months[None, None, :]))
+    reachable = payments <= income
+    any_reachable = reachable.any(axis=2)
+    earliest = np.where(any_reachable, reachable.argmax(axis=2) + 1, 0)
+    result = {
+        "income": income,
+        "total_needs": total_needs,
+        "target_amounts": targets.tolist(),
+        "interest_rates": rates.tolist(),
+        "horizons_months": horizons.tolist(),
+        "required_monthly_savings": required.tolist(),
+        "feasible": feasible.tolist(),
+        "within_discretionary_income": within_discretionary.tolist(),
+        "earliest_feasible_months": [[int(m) if m else None for m in row] for row in earliest]
+    }
+    if start_date:
+        result["end_dates"] = [add_months(start_date, m) for m in horizons]
+        result["earliest_feasible_end_dates"] = [[add_months(start_date, m) if m else None for m in row]
+                                                 for row in earliest]
+    return result
+
+def scenario_grid_from_input(input_data):
+    scenarios = input_data["scenarios"]
+    start_date = input_data.get("start_date")
+    targets = scenario_values(scenarios.get("target_amounts", input_data.get("target_amount")))
+    rates = scenario_values(scenarios.get("interest_rates", input_data.get("interest_rate")))
+    if "end_dates" in scenarios:
+        horizons = [months_between(start_date, end_date) for end_date in scenarios["end_dates"]]
+    elif "horizons_months" in scenarios:
+        horizons = scenario_values(scenarios["horizons_months"]).astype(np.int64)
+    else:
+        horizons = [months_between(start_date, input_data["end_date"])]
+    return feasibility_grid(float(input_data["income"]), input_data.get("expenses", []),
+                            targets, rates, horizons, start_date)
+
+def load_category_mapping(path=None):
+    # Mapping files use the DEFAULT_CATEGORY_MAPPING layout; any section they provide replaces the default one.
+    mapping = dict(DEFAULT_CATEGORY_MAPPING)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            mapping.update(json.load(f))
+    categories, keywords = {}, {}
+    for bucket in ("Needs", "Wants"):
+        section = mapping.get(bucket, {})
+        for category in section.get("categories", []):
+            categories.setdefault(category.lower(), bucket)
+        for keyword in section.get("keywords", []):
+            keywords.setdefault(keyword.lower(), bucket)
+    # Whole words only (with a plural ending), so "current" does not match "rent" nor "barber" match "bar".
+    alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    keyword_pattern = re.compile(r"\b(" + alternation + r")(?:s|es)?\b") if keywords else None
+    credit_sign = str(mapping.get("credit_sign") or "none").lower()
+    if credit_sign not in ("auto", "positive", "negative", "none"):
+        raise ValueError(f"credit_sign must be auto, positive, negative or none, not {credit_sign}")
+    return {
+        "categories": categories,
+        "keywords": keywords,
+        "keyword_pattern": keyword_pattern,
+        "columns": dict(DEFAULT_CATEGORY_MAPPING["columns"], **mapping.get("columns", {})),
+        "credit_types": {t.lower() for t in mapping.get("credit_types", [])},
+        "credit_sign": credit_sign
+    }
+
+def classify_transaction(description, category, mapping):
+    bucket = mapping["categories"].get(str(category or "").strip().lower())
+    if bucket:
+        return bucket
+    if mapping["keyword_pattern"] is None:
+        return "Savings"
+    match = mapping["keyword_pattern"].search(str(description or "").lower())
+    return mapping["keywords"][match.group(1)] if match else "Savings"
+
+def iter_statement_rows(path):
+    if path.endswith((".jsonl", ".ndjson", ".json")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+def aggregate_statement(path, mapping=None, chunk_size=STATEMENT_CHUNK_SIZE):
+    # Streams the export in chunks and keeps only a running {month: [needs, wants, savings]} table,
+    # so memory grows with the number of months rather than the number of transactions.
+    mapping = mapping or load_category_mapping()
+    cols = mapping["columns"]
+    bucket_index = {bucket: i for i, bucket in enumerate(BUCKETS)}
+    month_index, totals = {}, np.zeros((0, len(BUCKETS)))
+    credit_sign = mapping["credit_sign"]
+    rows = iter_statement_rows(path)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        parsed = []
+        for row in chunk:
+            try:
+                amount = float(str(row.get(cols["amount"])).replace(",", ""))
+                month = str(row.get(cols["date"]))[:7]
+                datetime.strptime(month, "%Y-%m")
+            except Exception:
+                continue
+            parsed.append((row, amount, month, str(row.get(cols["type"]) or "").strip().lower()))
+        untyped = [amount for _, amount, _, kind in parsed if not kind]
+        if credit_sign == "auto" and untyped:
+            credit_sign = "positive" if min(untyped) < 0 else "none"
+        keys, amounts = [], []
+        for row, amount, month, kind in parsed:
+            if kind:
+                if kind in mapping["credit_types"]:
+                    continue
+            elif (credit_sign == "positive" and amount > 0) or (credit_sign == "negative" and amount < 0):
+                continue
+            amount = abs(amount)
+            if month not in month_index:
+                month_index[month] = len(month_index)
+            bucket = classify_transaction(row.get(cols["description"]), row.get(cols["category"]), mapping)
+            keys.append(month_index[month] * len(BUCKETS) + bucket_index[bucket])
+            amounts.append(amount)
+        if len(month_index) > len(totals):
+            totals = np.vstack([totals, np.zeros((len(month_index) - len(totals), len(BUCKETS)))])
+        if keys:
+            totals += np.bincount(keys, weights=amounts, minlength=totals.size).reshape(totals.shape)
+    return {month: dict(zip(BUCKETS, np.round(totals[i], 2).tolist()))
+            for month, i in sorted(month_index.items())}
+
+def statement_totals(monthly, basis="average"):
+    # basis is "average" over all months, "latest" month, or a specific "YYYY-MM".
+    if not monthly:
+        return {bucket: 0.0 for bucket in BUCKETS}
+    if basis == "average":
+        return {bucket: round(sum(m[bucket] for m in monthly.values()) / len(monthly), 2) for bucket in BUCKETS}
+    if basis == "latest":
+        return monthly[max(monthly)]
+    if basis not in monthly:
+        raise ValueError(f"No transactions for month {basis}")
+    return monthly[basis]
+
+def optimize_from_statement(income, statement_path, target_amount, interest_rate, start_date, end_date,
+                            mapping_path=None, basis="average"):
+    with span("statement_ingest"):
+        monthly = aggregate_statement(statement_path, load_category_mapping(mapping_path))
+    totals = statement_totals(monthly, basis)
+    result = optimize_spending_totals(income, totals["Needs"], totals["Wants"], target_amount, interest_rate,
+                                      start_date, end_date)
+    return {"monthly_totals": monthly, "basis": basis, "totals": totals, "result": result}
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(description="Batch spending optimization over JSON-lines records")
+    parser.add_argument("--batch", action="store_true", help="Read JSON-lines records instead of a single JSON argument")
+    parser.add_argument("--input", type=str, default="-", help="JSON-lines input file, '-' for stdin")
+    parser.add_argument("--output", type=str, default="-", help="JSON-lines output file, '-' for stdout")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="Records evaluated per vectorized chunk")
+    args = parser.parse_args(argv)
+    infile = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        with profiled("spending_batch"):
+            run_batch(infile, outfile, max(1, args.chunk_size))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+def statement_main(argv):
+    parser = argparse.ArgumentParser(description="Spending optimization from a bank statement export")
+    parser.add_argument("--statement", type=str, required=True, help="Transaction export (.csv or JSON-lines)")
+    parser.add_argument("--mapping", type=str, default=None, help="JSON category/keyword mapping file")
+    parser.add_argument("--basis", type=str, default="average", help="average, latest, or a YYYY-MM month")
+    parser.add_argument("--income", type=float, required=True, help="Monthly income")
+    parser.add_argument("--target_amount", type=float, required=True, help="Target goal amount")
+    parser.add_argument("--interest_rate", type=float, required=True, help="Annual interest rate in percent")
+    parser.add_argument("--start_date", type=str, required=True, help="Goal start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, required=True, help="Goal end date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+    try:
+        result = optimize_from_statement(args.income, args.statement, args.target_amount, args.interest_rate,
+                                         args.start_date, args.end_date, args.mapping, args.basis)
+    except Exception as e:
+        print(json.dumps({"error": f"Could not process statement: {str(e)}"}))
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        batch_main(sys.argv[1:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "--statement":
+        statement_main(sys.argv[1:])
+        return
     if len(sys.argv) < 2:
         print(json.dumps({"error": "No input provided"}))
         sys.exit(1)
@@ -90,6 +516,14 @@ def main():
     except Exception as e:
         print(json.dumps({"error": f"Invalid JSON input: {str(e)}"}))
         sys.exit(1)
+    if isinstance(input_data, dict) and "scenarios" in input_data:
+        try:
+            result = scenario_grid_from_input(input_data)
+        except Exception as e:
+            print(json.dumps({"error": f"Invalid input format: {str(e)}"}))
+            sys.exit(1)
+        print(json.dumps(result, indent=2))
+        return
     try:
         income = float(input_data["income"])
         target_amount = float(input_data["target_amount"])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+from collections import deque
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+class TickerMatcher:
+    # Aho-Corasick automaton over company names and aliases: one left-to-right pass per text
+    # regardless of how many names are loaded.
+
+    def __init__(self, names, aliases=None):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        patterns = dict(names)
+        patterns.update(aliases or {})
+        for phrase, ticker in patterns.items():
+            if phrase:
+                self._add(phrase, ticker)
+        self._build()
+        self.size = len(patterns)
+
+    def _add(self, phrase, ticker):
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(phrase), ticker))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _on_boundary(self, text, start, end):
+        if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def find_all(self, text):
+        # Returns non-overlapping (start, end, ticker) mentions, preferring the longest phrase at each position.
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, ticker in out[node]:
+                start = i + 1 - length
+                if self._on_boundary(text, start, i + 1):
+                    candidates.append((start, i + 1, ticker))
+        candidates.sort(key=lambda m: (m[0], m[0] - m[1]))
+        mentions = []
+        last_end = 0
+        for start, end, ticker in candidates:
+            if start >= last_end:
+                mentions.append((start, end, ticker))
+                last_end = end
+        return mentions
+
+    def tickers(self, text):
+        return list(dict.fromkeys(ticker for _, _, ticker in self.find_all(text)))
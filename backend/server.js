@@ -4,9 +4,27 @@ const jwt = require("jsonwebtoken");
 const pool = require("./db");
 const { spawn, exec } = require("child_process");
 const path = require("path");
+const axios = require("axios");
 
 require("dotenv").config();
 
+// When set, analytics jobs go to the long-lived AL/analytics_service.py instead of a new python3 process per request.
+const ANALYTICS_SERVICE_URL = process.env.ANALYTICS_SERVICE_URL;
+const ANALYTICS_DEADLINE_SECONDS = Number(process.env.ANALYTICS_DEADLINE_SECONDS || 120);
+
+async function callAnalyticsService(route, payload) {
+  const response = await axios.post(`${ANALYTICS_SERVICE_URL}${route}`, payload, {
+    headers: { "X-Deadline": String(ANALYTICS_DEADLINE_SECONDS) },
+    timeout: (ANALYTICS_DEADLINE_SECONDS + 5) * 1000,
+    validateStatus: () => true,
+  });
+  if (response.status !== 200) {
+    const message = (response.data && response.data.error) || `status ${response.status}`;
+    throw new Error(`Analytics service ${route} failed: ${message}`);
+  }
+  return response.data;
+}
+
 const app = express();
 app.use("/static", express.static(path.join(__dirname, "static")));
 const corsOptions = {
@@ -102,46 +120,54 @@ async function getRecommendationForGoal(goal) {
       `--monthly_investment ${current_investment} ` +
       `--target_amount ${target_goal}`;
 
-    console.log("🚀 Running portfolio.py:", portfolioCmd);
-    
-    await new Promise((resolve, reject) => {
-      exec(portfolioCmd, async (portErr, portStdout, portStderr) => {
-        if (portErr) {
-          console.error("❌ Error running portfolio.py:", portErr);
-          return reject(portErr);
-        }
-        if (portStderr) {
-          console.error("⚠️ portfolio.py stderr:", portStderr);
-        }
-        let portfolioResult;
-        try {
-          portfolioResult = JSON.parse(portStdout.trim());
-        } catch (e) {
-          console.error("❌ JSON parse error from portfolio.py:", e);
-          return reject(new Error("Invalid JSON output from portfolio.py"));
-        }
-        // Expect portfolioResult to contain { recommendations, required_PMT }
-        const { recommendations, required_PMT } = portfolioResult;
-        const insertQuery = `
-          INSERT INTO portfolios (userid, assets, required_pmt)
-          VALUES ($1, $2, $3)
-          RETURNING *
-        `;
-        const insertValues = [
-          user_id,
-          JSON.stringify(recommendations),
-          required_PMT
-        ];
-        try {
-          const { rows: insertedPortfolio } = await pool.query(insertQuery, insertValues);
-          console.log("✅ Portfolio saved to DB");
-          resolve(insertedPortfolio[0]);
-        } catch (dbErr) {
-          console.error("❌ DB insertion error for portfolio:", dbErr);
-          return reject(dbErr);
-        }
+    let portfolioResult;
+    if (ANALYTICS_SERVICE_URL) {
+      portfolioResult = await callAnalyticsService("/portfolio", {
+        risk_level,
+        income: monthly_income,
+        goal_duration,
+        monthly_investment: current_investment,
+        target_amount: target_goal,
       });
-    });
+    } else {
+      console.log("🚀 Running portfolio.py:", portfolioCmd);
+      portfolioResult = await new Promise((resolve, reject) => {
+        exec(portfolioCmd, (portErr, portStdout, portStderr) => {
+          if (portErr) {
+            console.error("❌ Error running portfolio.py:", portErr);
+            return reject(portErr);
+          }
+          if (portStderr) {
+            console.error("⚠️ portfolio.py stderr:", portStderr);
+          }
+          try {
+            resolve(JSON.parse(portStdout.trim()));
+          } catch (e) {
+            console.error("❌ JSON parse error from portfolio.py:", e);
+            return reject(new Error("Invalid JSON output from portfolio.py"));
+          }
+        });
+      });
+    }
+    // Expect portfolioResult to contain { recommendations, required_PMT }
+    const { recommendations, required_PMT } = portfolioResult;
+    const insertQuery = `
+      INSERT INTO portfolios (userid, assets, required_pmt)
+      VALUES ($1, $2, $3)
+      RETURNING *
+    `;
+    const insertValues = [
+      user_id,
+      JSON.stringify(recommendations),
+      required_PMT
+    ];
+    try {
+      await pool.query(insertQuery, insertValues);
+      console.log("✅ Portfolio saved to DB");
+    } catch (dbErr) {
+      console.error("❌ DB insertion error for portfolio:", dbErr);
+      throw dbErr;
+    }
     
     // Re-read the portfolio record after insertion.
     const portfolioData = await pool.query(
@@ -171,43 +197,45 @@ async function getRecommendationForGoal(goal) {
     // Absolute path for modified_spa.py.
     const riskScript = "/Users/dhanyavenkatesh/Investomate/AL/modified_spa.py";
     const riskCmd = `${pythonPath} "${riskScript}" '${JSON.stringify(portfolioAssets)}'`;
-    console.log("🚀 Running modified_spa.py:", riskCmd);
-    
-    await new Promise((resolve, reject) => {
-      exec(riskCmd, async (riskErr, riskStdout, riskStderr) => {
-        if (riskErr) {
-          console.error("❌ Error running modified_spa.py:", riskErr);
-          return reject(riskErr);
-        }
-        if (riskStderr) {
-          console.error("⚠️ modified_spa.py stderr:", riskStderr);
-        }
-        let riskResult;
-        try {
-          riskResult = JSON.parse(riskStdout.trim());
-        } catch (e) {
-          console.error("❌ JSON parse error from modified_spa.py:", e);
-          return reject(new Error("Invalid JSON output from modified_spa.py"));
-        }
-        const insertQuery = `
-          INSERT INTO portfolio_analysis (portfolio_id, analysis)
-          VALUES ($1, $2)
-          RETURNING *
-        `;
-        const insertValues = [ 
-          portfolio_id, 
-          JSON.stringify(riskResult) 
-        ];
-        try {
-          const { rows: insertedAnalysis } = await pool.query(insertQuery, insertValues);
-          console.log("✅ Risk analysis saved to DB");
-          resolve(insertedAnalysis[0]);
-        } catch (dbErr) {
-          console.error("❌ DB insertion error for risk analysis:", dbErr);
-          return reject(dbErr);
-        }
+    let riskResult;
+    if (ANALYTICS_SERVICE_URL) {
+      riskResult = await callAnalyticsService("/risk-analysis", { investments: portfolioAssets });
+    } else {
+      console.log("🚀 Running modified_spa.py:", riskCmd);
+      riskResult = await new Promise((resolve, reject) => {
+        exec(riskCmd, (riskErr, riskStdout, riskStderr) => {
+          if (riskErr) {
+            console.error("❌ Error running modified_spa.py:", riskErr);
+            return reject(riskErr);
+          }
+          if (riskStderr) {
+            console.error("⚠️ modified_spa.py stderr:", riskStderr);
+          }
+          try {
+            resolve(JSON.parse(riskStdout.trim()));
+          } catch (e) {
+            console.error("❌ JSON parse error from modified_spa.py:", e);
+            return reject(new Error("Invalid JSON output from modified_spa.py"));
+          }
+        });
       });
-    });
+    }
+    const insertQuery = `
+      INSERT INTO portfolio_analysis (portfolio_id, analysis)
+      VALUES ($1, $2)
+      RETURNING *
+    `;
+    const insertValues = [ 
+      portfolio_id, 
+      JSON.stringify(riskResult) 
+    ];
+    try {
+      await pool.query(insertQuery, insertValues);
+      console.log("✅ Risk analysis saved to DB");
+    } catch (dbErr) {
+      console.error("❌ DB insertion error for risk analysis:", dbErr);
+      throw dbErr;
+    }
   } else {
     console.log("✅ Risk analysis exists in DB.");
   }
@@ -322,12 +350,22 @@ app.delete("/api/goals/:goalid", verifyToken, async (req, res) => {
   }
 });
 
-app.post("/simulate", (req, res) => {
+app.post("/simulate", async (req, res) => {
   const { ticker, years, initialAmount, monthlyContribution } = req.body;
   if (!ticker || !years || !initialAmount || !monthlyContribution) {
     return res.status(400).json({ error: "Missing required parameters" });
   }
 
+  if (ANALYTICS_SERVICE_URL) {
+    try {
+      const output = await callAnalyticsService("/simulate", { ticker, years, initialAmount, monthlyContribution });
+      return res.json(output);
+    } catch (err) {
+      console.error("Analytics service error:", err.message);
+      return res.status(500).json({ error: "Internal Server Error", details: err.message });
+    }
+  }
+
   const scriptPath = "/Users/dhanyavenkatesh/Investomate/AL/Investment_Simulation.py";
   const command = `python3 "${scriptPath}" --ticker "${ticker}" --years "${years}" --initialAmount "${initialAmount}" --monthlyContribution "${monthlyContribution}"`;
 
@@ -356,7 +394,15 @@ app.post("/simulate", (req, res) => {
   });
 });
 
-app.get("/api/insights", (req, res) => {
+app.get("/api/insights", async (req, res) => {
+  if (ANALYTICS_SERVICE_URL) {
+    try {
+      return res.json(await callAnalyticsService("/insights", {}));
+    } catch (err) {
+      console.error("Analytics service error:", err.message);
+      return res.status(500).json({ error: "Error generating insights" });
+    }
+  }
   const pythonProcess = spawn("python3", ["../AL/insights.py"]);
   let dataToSend = "";
   pythonProcess.stdout.on("data", (data) => {
@@ -376,7 +422,15 @@ app.get("/api/insights", (req, res) => {
   });
 });
 
-app.post("/api/optimize-spending", (req, res) => {
+app.post("/api/optimize-spending", async (req, res) => {
+  if (ANALYTICS_SERVICE_URL) {
+    try {
+      return res.json(await callAnalyticsService("/optimize-spending", req.body));
+    } catch (err) {
+      console.error("Analytics service error:", err.message);
+      return res.status(500).json({ error: err.message });
+    }
+  }
   const inputJson = JSON.stringify(req.body);
   const scriptPath = path.join(__dirname, "..", "AL", "spending_analysis.py");
   exec(`python3 "${scriptPath}" '${inputJson}'`, (error, stdout, stderr) => {